@@ -1,7 +1,7 @@
 import random
 from pprint import pprint
 from typing import Iterable, List, Any
-from util.worker_pool import WorkerPool, Task
+from util.worker_pool import WorkerPool, Task, JobFailure
 
 import numpy as np
 
@@ -54,7 +54,8 @@ def calc_scores(score_task: Task, scoring_jobs: List[Any], n_jobs):
         with score_task as task:
             scores = [task(job) for job in scoring_jobs]
     assert len(scores) == len(scoring_jobs)
-    assert all(s is not None for s in scores)
+    failures = [s for s in scores if isinstance(s, JobFailure)]
+    assert len(failures) == 0, failures[0]
     return scores
 
 
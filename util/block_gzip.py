@@ -0,0 +1,209 @@
+"""
+pigz-style gzip: data is cut into independent blocks that are compressed on a
+thread-pool (zlib releases the GIL) and written as members of a multi-member gzip-file,
+so the output stays readable by plain gzip
+every member carries its own size in the gzip extra-field (subfield "BL"),
+that way a reader finds the member boundaries without decompressing
+and can decompress members in parallel
+"""
+import concurrent.futures as cf
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from typing import Optional
+
+BLOCK_SIZE = 1024 * 1024
+SUBFIELD_ID = b"BL"
+FEXTRA = 4
+# magic, method, flags, mtime, extra-flags, os, xlen, subfield-id, subfield-len, size
+HEADER = struct.Struct("<2sBBIBBH2sHI")
+MAGIC = b"\x1f\x8b"
+TRAILER = struct.Struct("<II")
+
+
+def default_num_threads():
+    return min(8, os.cpu_count() or 1)
+
+
+def compress_block(data: bytes, compresslevel=6) -> bytes:
+    """
+    :return: a complete gzip-member
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    member_size = HEADER.size + len(deflated) + TRAILER.size
+    xlen = HEADER.size - 12
+    header = HEADER.pack(MAGIC, 8, FEXTRA, 0, 0, 255, xlen, SUBFIELD_ID, 4, member_size)
+    trailer = TRAILER.pack(zlib.crc32(data), len(data) & 0xFFFFFFFF)
+    return header + deflated + trailer
+
+
+def _parse_member_size(header: bytes):
+    """
+    :return: None if header is not of a block-gzip member
+    """
+    if len(header) < HEADER.size:
+        return None
+    magic, method, flags, _, _, _, xlen, subfield_id, _, size = HEADER.unpack(header)
+    if magic == MAGIC and flags & FEXTRA and subfield_id == SUBFIELD_ID:
+        return size
+    return None
+
+
+def is_block_gzip(file: str) -> bool:
+    with open(file, "rb") as f:
+        return _parse_member_size(f.read(HEADER.size)) is not None
+
+
+class BlockGzipWriter(io.BufferedIOBase):
+    def __init__(
+        self,
+        file: str,
+        mode="wb",
+        compresslevel=6,
+        num_threads: int = None,
+        block_size=BLOCK_SIZE,
+    ) -> None:
+        super().__init__()
+        assert mode in ["wb", "ab"]
+        self.fileobj = open(file, mode)
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        num_threads = num_threads if num_threads else default_num_threads()
+        self.executor = cf.ThreadPoolExecutor(max_workers=num_threads)
+        self.max_pending = 2 * num_threads
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.num_blocks = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self._submit_buffer()
+        return len(data)
+
+    def _submit_buffer(self):
+        block, self.buffer = bytes(self.buffer), bytearray()
+        self.num_blocks += 1
+        self.pending.append(
+            self.executor.submit(compress_block, block, self.compresslevel)
+        )
+        while len(self.pending) >= self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self._submit_buffer()
+        while len(self.pending) > 0:
+            self.fileobj.write(self.pending.popleft().result())
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.num_blocks == 0 and len(self.buffer) == 0:
+                self._submit_buffer()  # an empty member, a 0-byte file is no gzip
+            super().close()  # flushes
+        finally:
+            self.executor.shutdown()
+            self.fileobj.close()
+
+
+class BlockGzipReader(io.RawIOBase):
+    """
+    members without size-information (appended by some other gzip-writer)
+    are decompressed sequentially
+    """
+
+    def __init__(self, file: str, num_threads: int = None) -> None:
+        super().__init__()
+        self.fileobj = open(file, "rb")
+        num_threads = num_threads if num_threads else default_num_threads()
+        self.executor = cf.ThreadPoolExecutor(max_workers=num_threads)
+        self.max_pending = 2 * num_threads
+        self.pending = deque()
+        self.sequential = None
+        self.block = b""
+        self.block_pos = 0
+
+    def readable(self):
+        return True
+
+    def _submit_members(self):
+        while self.sequential is None and len(self.pending) < self.max_pending:
+            start = self.fileobj.tell()
+            header = self.fileobj.read(HEADER.size)
+            if len(header) == 0:
+                break
+            size = _parse_member_size(header)
+            if size is None:
+                self.fileobj.seek(start)
+                self.sequential = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                break
+            member = header + self.fileobj.read(size - HEADER.size)
+            self.pending.append(
+                self.executor.submit(zlib.decompress, member, zlib.MAX_WBITS | 16)
+            )
+
+    def _next_block(self) -> Optional[bytes]:
+        """
+        :return: None at the end of the file
+        """
+        self._submit_members()
+        if len(self.pending) > 0:
+            return self.pending.popleft().result()
+        elif self.sequential is not None:
+            return self._next_sequential_block()
+        else:
+            return None
+
+    def _next_sequential_block(self) -> Optional[bytes]:
+        while True:
+            if self.sequential.eof:
+                rest = self.sequential.unused_data
+                self.sequential = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                rest = b""
+            chunk = rest + self.fileobj.read(BLOCK_SIZE)
+            if len(chunk) == 0:
+                return None
+            block = self.sequential.decompress(chunk)
+            if len(block) > 0:
+                return block
+
+    def readinto(self, b):
+        while self.block_pos == len(self.block):
+            block = self._next_block()
+            if block is None:
+                return 0
+            self.block, self.block_pos = block, 0
+        n = min(len(b), len(self.block) - self.block_pos)
+        b[:n] = self.block[self.block_pos : self.block_pos + n]
+        self.block_pos += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown()
+        self.fileobj.close()
+        super().close()
+
+
+def open_block_gzip(file: str, mode="rb", num_threads: int = None, **kwargs):
+    """
+    :return: binary file-object, for reading a buffered one so that it can be
+        iterated line-wise
+    """
+    if "r" in mode:
+        return io.BufferedReader(BlockGzipReader(file, num_threads), BLOCK_SIZE)
+    else:
+        return BlockGzipWriter(file, mode, num_threads=num_threads, **kwargs)
@@ -0,0 +1,287 @@
+"""
+columnar on-disk cache for jsonl-files, every field is stored in its own binary file
+(plus an offsets-file for strings and lists) and read via np.memmap,
+so reading a column is zero-copy and never parses json
+
+kinds of columns:
+    number: bool, int64 or float64 array, missing values become NaN
+    string: utf-8 bytes + offsets, missing values become ""
+    numbers: list of numbers, flat array + offsets, missing values become []
+    json: anything else, json-bytes + offsets, missing values become None
+the kind of a column is that of its first value, a later value of another kind
+turns it into a json-column
+"""
+import json
+import os
+import shutil
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from util.data_io import read_jsonl
+from util.json_codec import get_codec
+from util.line_index import file_signature
+
+CACHE_SUFFIX = ".colcache"
+META_FILE = "meta.json"
+OFFSETS_DTYPE = np.int64
+
+
+def _column_files(folder: str, column_id: int):
+    """
+    files are named by number, field-names could contain anything
+    """
+    return (
+        os.path.join(folder, "%d.values" % column_id),
+        os.path.join(folder, "%d.offsets" % column_id),
+    )
+
+
+def _is_number(v):
+    return isinstance(v, (bool, int, float))
+
+
+def _kind_of(value) -> str:
+    if _is_number(value):
+        return "number"
+    elif isinstance(value, str):
+        return "string"
+    elif isinstance(value, list) and all(_is_number(v) for v in value):
+        return "numbers"
+    else:
+        return "json"
+
+
+def _number_dtype(values: List) -> np.dtype:
+    if any(v is None or isinstance(v, float) for v in values):
+        return np.dtype(np.float64)
+    elif all(isinstance(v, bool) for v in values):
+        return np.dtype(np.bool_)
+    else:
+        return np.dtype(np.int64)
+
+
+class _ColumnWriter(object):
+    def __init__(
+        self, folder: str, column_id: int, kind: str, num_missing: int
+    ) -> None:
+        self.values_file, self.offsets_file = _column_files(folder, column_id)
+        self.column_id = column_id
+        self.kind = kind
+        self.dtype = None  # only for number and numbers columns
+        self.num_rows = 0
+        self.values_end = 0  # number of values (or bytes) referenced by offsets
+        self.buffer = []
+        self.dumps = get_codec().dumps
+        open(self.values_file, "wb").close()
+        if kind != "number":
+            np.zeros(1, dtype=OFFSETS_DTYPE).tofile(self.offsets_file)
+        for _ in range(num_missing):
+            self.append(None)
+
+    def fits(self, value) -> bool:
+        return value is None or self.kind == "json" or _kind_of(value) == self.kind
+
+    def promote_to_json(self):
+        """
+        rewrites what has been written so far as json, values that were missing
+        keep the missing-value of the former kind ("" or []), except NaN which
+        becomes None
+        """
+        written = self._read_written()
+        self.kind = "json"
+        self.dtype = None
+        self.values_end = 0
+        open(self.values_file, "wb").close()
+        np.zeros(1, dtype=OFFSETS_DTYPE).tofile(self.offsets_file)
+        self.buffer = written + self.buffer
+        self.flush()
+
+    def _read_written(self) -> List:
+        dtype = self.dtype if self.dtype is not None else np.dtype(np.uint8)
+        values = np.fromfile(self.values_file, dtype=dtype)
+        if self.kind == "number":
+            return [None if v != v else v for v in values.tolist()]  # NaN
+        offsets = np.fromfile(self.offsets_file, dtype=OFFSETS_DTYPE)
+        rows = [values[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        if self.kind == "string":
+            return [_decode_string(row) for row in rows]
+        else:
+            return [row.tolist() for row in rows]
+
+    def append(self, value):
+        self.buffer.append(value)
+        self.num_rows += 1
+
+    def flush(self):
+        if self.kind == "number":
+            self._write_numbers(self.buffer)
+        elif self.kind == "numbers":
+            self._write_numbers([v for l in self.buffer if l is not None for v in l])
+            self._write_offsets([0 if l is None else len(l) for l in self.buffer])
+        else:
+            if self.kind == "string":
+                encode = lambda s: s.encode("utf-8")
+            else:
+                encode = self.dumps
+            encoded = [b"" if v is None else encode(v) for v in self.buffer]
+            with open(self.values_file, "ab") as f:
+                f.write(b"".join(encoded))
+            self._write_offsets([len(b) for b in encoded])
+        self.buffer = []
+
+    def _write_numbers(self, values: List):
+        if len(values) == 0:
+            return
+        dtype = _number_dtype(values)
+        if self.dtype is not None:
+            dtype = np.promote_types(self.dtype, dtype)
+            if dtype != self.dtype:  # promote what has been written so far
+                written = np.fromfile(self.values_file, dtype=self.dtype)
+                written.astype(dtype).tofile(self.values_file)
+        self.dtype = dtype
+        array = np.asarray([np.nan if v is None else v for v in values], dtype=dtype)
+        with open(self.values_file, "ab") as f:
+            array.tofile(f)
+
+    def _write_offsets(self, lengths: List[int]):
+        if len(lengths) == 0:
+            return
+        offsets = self.values_end + np.cumsum(lengths, dtype=OFFSETS_DTYPE)
+        with open(self.offsets_file, "ab") as f:
+            offsets.tofile(f)
+        self.values_end = int(offsets[-1])
+
+    def meta(self) -> Dict[str, str]:
+        if self.kind in ["number", "numbers"]:
+            dtype = self.dtype if self.dtype is not None else np.dtype(np.float64)
+        else:
+            dtype = np.dtype(np.uint8)
+        return {"id": self.column_id, "kind": self.kind, "dtype": dtype.str}
+
+
+def write_columnar_cache(
+    records: Iterable[Dict], folder: str, source_file: str = None, chunk_size=10_000
+):
+    """
+    builds into a temporary folder which replaces folder once it is complete
+    """
+    source = file_signature(source_file) if source_file is not None else None
+    tmp_folder = folder + ".tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    columns: Dict[str, _ColumnWriter] = {}
+    num_rows = 0
+    for d in records:
+        for name, value in d.items():
+            if name not in columns:
+                if value is None:
+                    continue
+                columns[name] = _ColumnWriter(
+                    tmp_folder, len(columns), _kind_of(value), num_rows
+                )
+            column = columns[name]
+            if not column.fits(value):
+                column.promote_to_json()
+            column.append(value)
+        num_rows += 1
+        for column in columns.values():
+            if column.num_rows < num_rows:
+                column.append(None)
+            if len(column.buffer) >= chunk_size:
+                column.flush()
+
+    for column in columns.values():
+        column.flush()
+    meta = {
+        "num_rows": num_rows,
+        "columns": {name: c.meta() for name, c in columns.items()},
+        "source": source,
+    }
+    with open(os.path.join(tmp_folder, META_FILE), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.rename(tmp_folder, folder)
+
+
+def _memmap(file: str, dtype) -> np.ndarray:
+    if os.path.getsize(file) == 0:  # mmap can not map empty files
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode="r")
+
+
+class RaggedColumn(object):
+    """
+    row k is values[offsets[k] : offsets[k + 1]], decoded only on access
+    """
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray, decode=None) -> None:
+        self.values = values
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k: int):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        row = self.values[self.offsets[k] : self.offsets[k + 1]]
+        return self.decode(row) if self.decode is not None else row
+
+    def __iter__(self):
+        return (self[k] for k in range(len(self)))
+
+
+def _decode_string(row: np.ndarray) -> str:
+    return row.tobytes().decode("utf-8")
+
+
+def _decode_json(row: np.ndarray):
+    return get_codec().loads(row.tobytes()) if len(row) > 0 else None
+
+
+class ColumnarCache(object):
+    def __init__(self, folder: str) -> None:
+        self.folder = folder
+        with open(os.path.join(folder, META_FILE), "r") as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return self.meta["num_rows"]
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.meta["columns"].keys())
+
+    def __getitem__(self, field: str):
+        """
+        :return: np.memmap for number-columns, RaggedColumn otherwise
+        """
+        column = self.meta["columns"][field]
+        values_file, offsets_file = _column_files(self.folder, column["id"])
+        values = _memmap(values_file, np.dtype(column["dtype"]))
+        if column["kind"] == "number":
+            return values
+        decode = {"string": _decode_string, "numbers": None, "json": _decode_json}[
+            column["kind"]
+        ]
+        return RaggedColumn(values, _memmap(offsets_file, OFFSETS_DTYPE), decode)
+
+
+def columnar_cache(jsonl_file: str, folder: str = None) -> ColumnarCache:
+    """
+    (re)builds the cache if the jsonl-file changed (size or modification-time)
+    :param folder: defaults to jsonl_file + ".colcache"
+    """
+    folder = folder if folder is not None else jsonl_file + CACHE_SUFFIX
+    meta_file = os.path.join(folder, META_FILE)
+    is_valid = False
+    if os.path.isfile(meta_file):
+        with open(meta_file, "r") as f:
+            is_valid = json.load(f)["source"] == file_signature(jsonl_file)
+    if not is_valid:
+        write_columnar_cache(read_jsonl(jsonl_file), folder, source_file=jsonl_file)
+    return ColumnarCache(folder)
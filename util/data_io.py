@@ -1,32 +1,156 @@
 import gzip
+import io
 import json
+import multiprocessing
+import queue
 import re
+import shutil
+import tarfile
+import threading
+import zipfile
+from collections import deque
+from fnmatch import fnmatchcase
 from functools import partial
-from typing import Dict, List, Iterable
+from itertools import islice
+from typing import Any, Callable, Dict, List, Iterable, Optional
 import os
 
+from util.block_gzip import is_block_gzip, open_block_gzip
+from util.downloader import download_file
+from util.json_codec import get_codec
+from util.line_index import (
+    INDEX_SUFFIX,
+    IndexedLineWriter,
+    load_line_index,
+    open_at_line,
+)
+
+
+def _open_for_writing(file: str, mode: str, index_step=None, compress_threads=None):
+    if index_step is not None:
+        if compress_threads:
+            raise ValueError("line-indexing does not work with block-gzip")
+        return IndexedLineWriter(file, index_step, mode)
+    elif file.endswith("gz") and compress_threads:
+        # binary for "w" and "a" as well, like gzip.open
+        binary_mode = mode.replace("t", "").replace("b", "") + "b"
+        return open_block_gzip(file, binary_mode, compress_threads)
+    elif file.endswith("gz"):
+        return gzip.open(file, mode=mode)
+    else:
+        return open(file, mode=mode)
+
+
+def _open_for_reading(file: str):
+    """
+    block-gzip files (see util.block_gzip) are decompressed in parallel
+    """
+    if file.endswith("gz") and is_block_gzip(file):
+        return open_block_gzip(file, "rb")
+    elif file.endswith("gz"):
+        return gzip.open(file, mode="rb")
+    else:
+        return open(file, mode="rb")
+
+
+class PrefetchReader(io.RawIOBase):
+    """
+    reads (and thereby decompresses) chunks of the wrapped binary file on a
+    background thread into a bounded queue, so that I/O overlaps with the consumer,
+    at most queue_depth chunks are held in memory
+    """
+
+    def __init__(self, f, queue_depth=4, chunk_size=1024 * 1024) -> None:
+        super().__init__()
+        self.f = f
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=queue_depth)
+        self.stop = threading.Event()
+        self.chunk = b""
+        self.chunk_pos = 0
+        self.eof = False
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            for chunk in iter(lambda: self.f.read(self.chunk_size), b""):
+                if not self._put(chunk):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.chunk_pos == len(self.chunk):
+            if self.eof:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            elif chunk is None:
+                self.eof = True
+                return 0
+            self.chunk, self.chunk_pos = chunk, 0
+        n = min(len(b), len(self.chunk) - self.chunk_pos)
+        b[:n] = self.chunk[self.chunk_pos : self.chunk_pos + n]
+        self.chunk_pos += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        self.stop.set()
+        self.thread.join()
+        self.f.close()
+        super().close()
+
+
+def write_jsonl(
+    file: str,
+    data: Iterable[Dict],
+    mode="wb",
+    index_step=None,
+    codec: str = None,
+    compress_threads: int = None,
+):
+    """
+    :param index_step: if set a sidecar line-index is build while writing (every
+        index_step-th line), it makes num_to_skip in read_jsonl nearly O(1)
+    :param codec: name of the json-codec, None selects the stdlib-json,
+        see util.json_codec for the faster but lossy ones
+    :param compress_threads: if set gz-files are written as block-gzip,
+        compressed by that many threads
+    """
+    dumps = get_codec(codec).dumps
 
-def write_jsonl(file: str, data: Iterable[Dict], mode="wb"):
     def process_line(d: Dict):
-        line = json.dumps(d, skipkeys=True, ensure_ascii=False)
-        line = line + "\n"
-        if "b" in mode:
-            line = line.encode("utf-8")
+        line = dumps(d) + b"\n"
+        if "b" not in mode:
+            line = line.decode("utf-8")
         return line
 
-    with gzip.open(file, mode=mode) if file.endswith("gz") else open(
-        file, mode=mode
-    ) as f:
+    with _open_for_writing(file, mode, index_step, compress_threads) as f:
         f.writelines((process_line(d) for d in data))
 
 
-def write_json(file: str, datum: Dict, mode="wb"):
-    with gzip.open(file, mode=mode) if file.endswith("gz") else open(
-        file, mode=mode
-    ) as f:
-        line = json.dumps(datum, skipkeys=True, ensure_ascii=False)
-        if "b" in mode:
-            line = line.encode("utf-8")
+def write_json(file: str, datum: Dict, mode="wb", codec: str = None):
+    with _open_for_writing(file, mode) as f:
+        line = get_codec(codec).dumps(datum)
+        if "b" not in mode:
+            line = line.decode("utf-8")
         f.write(line)
 
 
@@ -37,22 +161,234 @@ def write_file(file, s: str, mode="wb"):
         f.write(s.encode("utf-8"))
 
 
-def write_lines(file, lines: Iterable[str], mode="wb"):
+def write_lines(
+    file, lines: Iterable[str], mode="wb", index_step=None, compress_threads=None
+):
     def process_line(line):
         line = line + "\n"
         return line.encode("utf-8")
 
-    with gzip.open(file, mode=mode) if file.endswith(".gz") else open(
-        file, mode=mode
-    ) as f:
+    with _open_for_writing(file, mode, index_step, compress_threads) as f:
         f.writelines((process_line(l) for l in lines))
 
 
-def read_lines_from_files(path: str, mode="b", encoding="utf-8", limit=None):
-    g = (
-        line
-        for file in os.listdir(path)
-        for line in read_lines(os.path.join(path, file), mode, encoding)
+class ShardedJsonlWriter(object):
+    """
+    long-lived jsonl-writer that buffers encoded records into large writes and
+    rotates to a new shard (part-00000.jsonl.gz, part-00001.jsonl.gz, ...) after
+    max_records or max_bytes (uncompressed), a shard is written as hidden file and
+    renamed once it is complete, so read_lines_from_files only sees complete shards
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        max_records: int = None,
+        max_bytes: int = None,
+        prefix="part",
+        suffix=".jsonl.gz",
+        buffer_size=4 * 1024 * 1024,
+        codec: str = None,
+        compress_threads: int = None,
+    ) -> None:
+        self.folder = folder
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.suffix = suffix
+        self.buffer_size = buffer_size
+        self.dumps = get_codec(codec).dumps
+        self.compress_threads = compress_threads
+        self.shard_idx = -1
+        self.f = None
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.shard_files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _shard_name(self, idx: int):
+        return "%s-%05d%s" % (self.prefix, idx, self.suffix)
+
+    def _open_next_shard(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.shard_idx += 1
+        while os.path.exists(
+            os.path.join(self.folder, self._shard_name(self.shard_idx))
+        ):
+            self.shard_idx += 1
+        self.tmp_file = os.path.join(
+            self.folder, "." + self._shard_name(self.shard_idx)
+        )
+        self.f = _open_for_writing(
+            self.tmp_file, "wb", compress_threads=self.compress_threads
+        )
+        self.shard_records = 0
+        self.shard_bytes = 0
+
+    def _is_shard_full(self):
+        return (
+            self.max_records is not None and self.shard_records >= self.max_records
+        ) or (self.max_bytes is not None and self.shard_bytes >= self.max_bytes)
+
+    def write(self, record: Dict):
+        if self.f is None or self._is_shard_full():
+            self._close_shard()
+            self._open_next_shard()
+        line = self.dumps(record) + b"\n"
+        self.buffer.append(line)
+        self.buffer_bytes += len(line)
+        self.shard_records += 1
+        self.shard_bytes += len(line)
+        if self.buffer_bytes >= self.buffer_size:
+            self.flush()
+
+    def write_batch(self, records: Iterable[Dict]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.f.write(b"".join(self.buffer))
+            self.buffer = []
+            self.buffer_bytes = 0
+
+    def _close_shard(self):
+        if self.f is None:
+            return
+        self.flush()
+        self.f.close()
+        self.f = None
+        shard_file = os.path.join(self.folder, self._shard_name(self.shard_idx))
+        os.rename(self.tmp_file, shard_file)
+        self.shard_files.append(shard_file)
+
+    def close(self):
+        self._close_shard()
+
+
+def _read_shard(file, mode, encoding, as_jsonl, chunk_size, out):
+    """
+    runs in a reader-process, puts (file, chunk) with chunks of at most chunk_size
+    lines, (file, None) at the end of the shard or (file, exception)
+    """
+    try:
+        if as_jsonl:
+            g = read_jsonl(file, mode)
+        else:
+            g = read_lines(file, mode, encoding)
+        for chunk in iter(lambda: list(islice(g, chunk_size)), []):
+            out.put((file, chunk))
+        out.put((file, None))
+    except Exception as e:
+        out.put((file, e))
+
+
+def _list_shards(path: str):
+    """
+    hidden files (shards that are still being written), line-index sidecars and
+    folders (like the default location of a columnar_cache) are not shards
+    """
+    files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    return [
+        f
+        for f in files
+        if not os.path.basename(f).startswith(".")
+        and not f.endswith(INDEX_SUFFIX)
+        and os.path.isfile(f)
+    ]
+
+
+SHARD_CHUNK_SIZE = 10_000  # lines per chunk a reader-process hands over
+SHARD_CHUNKS_AHEAD = 8
+
+
+def _read_shards(files, num_processes, ordered, mode, encoding, as_jsonl):
+    if num_processes > 1:
+        yield from _read_shards_parallel(
+            files, num_processes, ordered, mode, encoding, as_jsonl
+        )
+    else:
+        for file in files:
+            if as_jsonl:
+                yield from read_jsonl(file, mode)
+            else:
+                yield from read_lines(file, mode, encoding)
+
+
+def _read_shards_parallel(files, num_processes, ordered, mode, encoding, as_jsonl):
+    """
+    shards are streamed in chunks of SHARD_CHUNK_SIZE lines by up to num_processes
+    reader-processes, each at most SHARD_CHUNKS_AHEAD chunks ahead of the consumer,
+    so memory stays bounded even for large shards and a slow consumer
+    ordered: every reader has its own queue, consumed one shard after the other
+    not ordered: all readers share one queue, chunks of different shards interleave
+    """
+    files = iter(files)
+    shared = None
+    if not ordered:
+        shared = multiprocessing.Queue(SHARD_CHUNKS_AHEAD * num_processes)
+    readers = deque()  # (file, process, queue) in the order of the files
+
+    def start(file):
+        out = shared
+        if out is None:
+            out = multiprocessing.Queue(SHARD_CHUNKS_AHEAD)
+        p = multiprocessing.Process(
+            target=_read_shard,
+            args=(file, mode, encoding, as_jsonl, SHARD_CHUNK_SIZE, out),
+            daemon=True,
+        )
+        p.start()
+        readers.append((file, p, out))
+
+    def get(out):
+        while True:
+            try:
+                return out.get(timeout=1.0)
+            except queue.Empty:  # readers still listed have not finished their shard
+                exited = [p for _, p, o in readers if o is out and not p.is_alive()]
+                if len(exited) > 0 and out.empty():
+                    raise RuntimeError(
+                        "shard-reader exited with exit-code %d" % exited[0].exitcode
+                    )
+
+    try:
+        for file in islice(files, num_processes):
+            start(file)
+        while len(readers) > 0:
+            file, chunk = get(readers[0][2] if ordered else shared)
+            if isinstance(chunk, Exception):
+                raise chunk
+            elif chunk is not None:
+                yield from chunk
+            else:  # end of shard
+                reader = next(r for r in readers if r[0] == file)
+                readers.remove(reader)
+                reader[1].join()
+                for file in islice(files, 1):
+                    start(file)
+    finally:
+        for _, p, _ in readers:
+            p.terminate()
+            p.join()
+
+
+def read_lines_from_files(
+    path: str, mode="b", encoding="utf-8", limit=None, num_processes=0, ordered=True
+):
+    """
+    :param num_processes: if > 1 the shards (files in path) are read by as many
+        processes, which hand over chunks of SHARD_CHUNK_SIZE lines
+    :param ordered: if False lines of different shards interleave (chunk-wise) in
+        the order they are read, lines within a shard are always in order
+    """
+    g = _read_shards(
+        _list_shards(path), num_processes, ordered, mode, encoding, as_jsonl=False
     )
     for c, line in enumerate(g):
         if limit and (c >= limit):
@@ -60,12 +396,48 @@ def read_lines_from_files(path: str, mode="b", encoding="utf-8", limit=None):
         yield line
 
 
-def read_lines(file, mode="b", encoding="utf-8", limit=None):
+def read_jsonl_from_files(
+    path: str, mode="b", limit=None, num_processes=0, ordered=True
+):
+    g = _read_shards(
+        _list_shards(path), num_processes, ordered, mode, None, as_jsonl=True
+    )
+    for c, d in enumerate(g):
+        if limit and (c >= limit):
+            break
+        yield d
+
+
+def _open_at_line(file: str, num_to_skip: int, prefetch=0):
+    """
+    uses the sidecar line-index (if there is a valid one) to jump close to the line
+    :param prefetch: if > 0 chunks are read ahead by a background thread,
+        prefetch is the maximal number of chunks in the queue
+    """
+    index = load_line_index(file) if num_to_skip > 0 else None
+    if index is not None:
+        f, num_to_skip = open_at_line(file, num_to_skip, index)
+    else:
+        f = _open_for_reading(file)
+    if prefetch > 0:
+        f = io.BufferedReader(PrefetchReader(f, queue_depth=prefetch))
+    for _ in range(num_to_skip):
+        f.readline()
+    return f
+
+
+def read_lines(file, mode="b", encoding="utf-8", limit=None, num_to_skip=0, prefetch=0):
+    """
+    :param prefetch: queue-depth of read-ahead thread (in chunks of 1MB), 0 disables
+    """
     assert any([mode == m for m in ["b", "t"]])
     counter = 0
-    with gzip.open(file, mode="r" + mode) if file.endswith(".gz") else open(
-        file, mode="r" + mode
-    ) as f:
+    if mode == "b":
+        f = _open_at_line(file, num_to_skip, prefetch)
+    else:
+        f = io.TextIOWrapper(_open_at_line(file, 0, prefetch), encoding=encoding)
+        [f.readline() for _ in range(num_to_skip)]
+    with f:
         for line in f:
             counter += 1
             if limit and (counter > limit):
@@ -75,25 +447,165 @@ def read_lines(file, mode="b", encoding="utf-8", limit=None):
             yield line.replace("\n", "")
 
 
-def read_jsonl(file, mode="b", limit=None, num_to_skip=0):
+def read_jsonl(
+    file,
+    mode="b",
+    limit=None,
+    num_to_skip=0,
+    codec: str = None,
+    batch_size=1024,
+    prefetch=0,
+    fields: List[str] = None,
+    where: Dict[str, Any] = None,
+    predicate: Callable[[Dict], bool] = None,
+):
+    """
+    lines are always read binary and decoded batch-wise by the json-codec
+    :param num_to_skip: uses the sidecar line-index if write_jsonl created one
+    :param prefetch: queue-depth of read-ahead thread (in chunks of 1MB), 0 disables
+    :param fields: only these keys are kept
+    :param where: field -> value that records must equal (bools only equal bools),
+        lines not containing the json-encoded value are rejected before parsing
+    :param predicate: further filter on the parsed records
+    :param limit: maximal number of (filtered) records
+    """
     assert any([mode == m for m in ["b", "t"]])
-    with gzip.open(file, mode="r" + mode) if file.endswith(".gz") else open(
-        file, mode="rb"
-    ) as f:
-        [next(f) for _ in range(num_to_skip)]
-        for k, line in enumerate(f):
-            if limit and (k >= limit):
-                break
-            yield json.loads(line.decode("utf-8") if mode == "b" else line)
+    with _open_at_line(file, num_to_skip, prefetch) as f:
+        yield from _decode_jsonl(f, limit, codec, batch_size, fields, where, predicate)
 
 
-def read_json(file: str, mode="b"):
-    with gzip.open(file, mode="r" + mode) if file.endswith("gz") else open(
-        file, mode="r" + mode
-    ) as f:
-        s = f.read()
-        s = s.decode("utf-8") if mode == "b" else s
-        return json.loads(s)
+def _decode_jsonl(
+    lines: Iterable[bytes],
+    limit,
+    codec: str,
+    batch_size: int,
+    fields: List[str] = None,
+    where: Dict[str, Any] = None,
+    predicate: Callable[[Dict], bool] = None,
+):
+    loads_batch = get_codec(codec).loads_batch
+    if where is None and predicate is None:
+        lines = islice(lines, limit) if limit else iter(lines)
+        records = (
+            d
+            for batch in iter(lambda: list(islice(lines, batch_size)), [])
+            for d in loads_batch(batch)
+        )
+    else:
+        records = _filter_records(
+            iter(lines), loads_batch, batch_size, where, predicate
+        )
+        records = islice(records, limit) if limit else records
+    if fields is not None:
+        records = ({k: d[k] for k in fields if k in d} for d in records)
+    yield from records
+
+
+def _raw_needle(value) -> Optional[bytes]:
+    """
+    bytes that must occur in a raw json-line containing value, None if there is no
+    unambiguous encoding (floats, escaped or non-ascii strings, "/" which ujson
+    escapes as "\\/")
+    """
+    if value is None or isinstance(value, (bool, int)):
+        return json.dumps(value).encode("utf-8")
+    elif isinstance(value, str) and "/" not in value:
+        encoded = json.dumps(value)
+        return encoded.encode("utf-8") if encoded[1:-1] == value else None
+    else:
+        return None
+
+
+def _filter_records(lines, loads_batch, batch_size, where, predicate):
+    where = where if where is not None else {}
+    needles = [n for n in (_raw_needle(v) for v in where.values()) if n is not None]
+
+    def is_match(d: Dict):
+        return all(_equals(d.get(k, _MISSING), v) for k, v in where.items()) and (
+            predicate is None or predicate(d)
+        )
+
+    for batch in iter(lambda: list(islice(lines, batch_size)), []):
+        for needle in needles:  # cheap substring-test before parsing
+            batch = [l for l in batch if needle in l]
+        yield from (d for d in loads_batch(batch) if is_match(d))
+
+
+_MISSING = object()
+
+
+def _equals(found, value) -> bool:
+    """
+    like ==, but true/false in json never equal 1/0, as the raw needle of one does
+    not occur in lines containing the other
+    """
+    return found == value and isinstance(found, bool) == isinstance(value, bool)
+
+
+def read_json(file: str, mode="b", codec: str = None):
+    with _open_for_reading(file) as f:
+        return get_codec(codec).loads(f.read())
+
+
+def _iter_archive_members(archive: str, pattern: str):
+    """
+    streams members of a zip- or (compressed) tar-archive without extracting them,
+    members ending with .gz are decompressed on the fly
+    :return: generator of (member-name, binary file-object)
+    """
+    if archive.endswith(".zip") or archive.endswith(".ZIP"):
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                if not info.is_dir() and fnmatchcase(info.filename, pattern):
+                    with z.open(info) as f:
+                        yield info.filename, f
+    else:
+        with tarfile.open(archive, mode="r|*") as t:
+            for member in t:
+                if member.isfile() and fnmatchcase(member.name, pattern):
+                    yield member.name, t.extractfile(member)
+
+
+def _read_archive_lines(archive: str, pattern: str):
+    for name, f in _iter_archive_members(archive, pattern):
+        if name.endswith(".gz"):
+            f = gzip.GzipFile(fileobj=f, mode="rb")
+        yield from f
+
+
+def read_lines_from_archive(archive: str, pattern="*", encoding="utf-8", limit=None):
+    """
+    :param pattern: glob on the member-names like "*/train/*.txt"
+    """
+    lines = _read_archive_lines(archive, pattern)
+    for line in islice(lines, limit) if limit else lines:
+        yield line.decode(encoding).replace("\n", "")
+
+
+def read_jsonl_from_archive(
+    archive: str, pattern="*", limit=None, codec: str = None, batch_size=1024
+):
+    yield from _decode_jsonl(
+        _read_archive_lines(archive, pattern), limit, codec, batch_size
+    )
+
+
+def _extract_zip(file, extract_folder):
+    with zipfile.ZipFile(file) as z:
+        z.extractall(extract_folder)
+
+
+def _extract_tar(file, extract_folder):
+    with tarfile.open(file, mode="r:gz") as t:
+        t.extractall(extract_folder, filter="data")  # rejects paths outside
+
+
+def _extract_gz(file, extract_folder):
+    name = re.sub(r"\.(gz|GZ)$", "", os.path.basename(file))
+    with gzip.open(file, mode="rb") as f_in, open(
+        os.path.join(extract_folder, name), "wb"
+    ) as f_out:
+        shutil.copyfileobj(f_in, f_out)
 
 
 def download_data(
@@ -104,16 +616,17 @@ def download_data(
     unzip_it=False,
     do_raise=True,
     remove_zipped=False,
+    checksum: str = None,
 ):
+    """
+    :param checksum: "<algorithm>:<hexdigest>", see util.downloader
+    """
     if not os.path.exists(data_folder):
         os.makedirs(data_folder, exist_ok=True)
 
     url = base_url + "/" + file_name
     file = data_folder + "/" + file_name
 
-    def extract(extract_folder, file, build_command):
-        assert os.system(build_command(extract_folder, file)) == 0
-
     try:
         if unzip_it:
             suffixes = [".zip", ".ZIP", ".tar.gz", ".tgz", ".gz", ".GZ"]
@@ -121,36 +634,41 @@ def download_data(
             extract_folder = re.sub(regex, "", file)
 
             if any(file.endswith(suf) for suf in [".zip", ".ZIP"]):
-                build_command = lambda dir, file: "unzip -d %s %s" % (dir, file,)
+                extract = _extract_zip
             elif any(file.endswith(suf) for suf in [".tar.gz", ".tgz"]):
-                build_command = lambda dir, file: "tar xzf %s -C %s" % (file, dir)
+                extract = _extract_tar
             elif any(file.endswith(suf) for suf in [".gz", ".GZ"]):
-                build_command = lambda dir, file: "gzip -dc %s %s" % (file, dir)
+                extract = _extract_gz
             else:
                 raise NotImplementedError
 
             if not os.path.isdir(extract_folder):
-                wget_file(url, data_folder, verbose)
-                assert os.system("mkdir %s" % extract_folder) == 0
-                extract(extract_folder, file, build_command)
+                wget_file(url, data_folder, verbose, checksum)
+                tmp_folder = extract_folder + ".tmp"
+                shutil.rmtree(tmp_folder, ignore_errors=True)
+                os.makedirs(tmp_folder)
+                extract(file, tmp_folder)
+                os.rename(tmp_folder, extract_folder)
                 if remove_zipped:
                     os.remove(file)
 
         else:
             if not os.path.isfile(file):
-                wget_file(url, data_folder, verbose)
+                wget_file(url, data_folder, verbose, checksum)
     except FileNotFoundError as e:
         if do_raise:
             raise e
 
 
-def wget_file(url, data_folder, verbose=False):
-    # TODO(tilo): use wget.download(url, split_dir)
-    err_code = os.system(
-        "wget -c -N%s -P %s %s" % (" -q" if not verbose else "", data_folder, url)
-    )
-    if err_code != 0:
-        raise FileNotFoundError("could not downloaded %s" % url.split("/")[-1])
+def wget_file(url, data_folder, verbose=False, checksum: str = None):
+    """
+    no longer uses wget, see util.downloader
+    """
+    file = os.path.join(data_folder, url.split("/")[-1])
+    try:
+        download_file(url, file, checksum=checksum, verbose=verbose)
+    except OSError as e:
+        raise FileNotFoundError("could not downloaded %s" % url.split("/")[-1]) from e
 
 
 if __name__ == "__main__":
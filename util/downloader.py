@@ -0,0 +1,212 @@
+"""
+pure-python downloader: large files are fetched as concurrent http-range-requests
+into a ".part"-file, finished ranges are recorded in a ".part.json"-file,
+so an interrupted download resumes where it stopped
+"""
+import concurrent.futures as cf
+import hashlib
+import json
+import os
+import re
+import threading
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+PART_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def _request(url: str, timeout: float, byte_range: Tuple[int, int] = None):
+    headers = {"User-Agent": "util-downloader"}
+    if byte_range is not None:
+        headers["Range"] = "bytes=%d-%d" % byte_range
+    request = urllib.request.Request(url, headers=headers)
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def _probe(url: str, timeout: float) -> Optional[int]:
+    """
+    :return: size of the file if the server supports range-requests, else None
+    """
+    with _request(url, timeout, (0, 0)) as response:
+        content_range = response.headers.get("Content-Range", "")
+        match = re.match(r"bytes 0-0/(\d+)", content_range)
+        if response.status == 206 and match is not None:
+            return int(match.group(1))
+    return None
+
+
+def verify_checksum(file: str, checksum: str):
+    """
+    :param checksum: "<algorithm>:<hexdigest>" like "sha256:9f86d0..."
+    """
+    algorithm, expected = checksum.split(":", 1)
+    h = hashlib.new(algorithm)
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            h.update(block)
+    if h.hexdigest() != expected.lower():
+        raise ValueError(
+            "%s: %s-checksum is %s, expected %s"
+            % (file, algorithm, h.hexdigest(), expected)
+        )
+
+
+class _RangeState(object):
+    """
+    which parts of a ".part"-file are already downloaded, persisted as json
+    """
+
+    def __init__(self, state_file: str, url: str, size: int, part_size: int) -> None:
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        self.state = {"url": url, "size": size, "part_size": part_size, "done": []}
+        if os.path.isfile(state_file):
+            with open(state_file, "r") as f:
+                state = json.load(f)
+            if all(state[k] == self.state[k] for k in ["url", "size", "part_size"]):
+                self.state = state
+
+    def parts_todo(self) -> List[Tuple[int, int]]:
+        size, part_size = self.state["size"], self.state["part_size"]
+        done = set(self.state["done"])
+        return [
+            (start, min(start + part_size, size) - 1)
+            for start in range(0, size, part_size)
+            if start not in done
+        ]
+
+    def reset(self):
+        """
+        forgets all finished parts, for when the ".part"-file is (re)created
+        """
+        with self.lock:
+            self.state["done"] = []
+            if os.path.isfile(self.state_file):
+                os.remove(self.state_file)
+
+    def mark_done(self, start: int):
+        with self.lock:
+            self.state["done"].append(start)
+            tmp_file = self.state_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_file, self.state_file)
+
+
+def _download_range(url, part_file, byte_range, timeout, connections):
+    with connections:
+        with _request(url, timeout, byte_range) as response, open(
+            part_file, "r+b"
+        ) as f:
+            if response.status != 206:
+                raise IOError("%s: server ignored range-request" % url)
+            f.seek(byte_range[0])
+            for block in iter(lambda: response.read(READ_SIZE), b""):
+                f.write(block)
+            if f.tell() != byte_range[1] + 1:
+                raise IOError("%s: range %d-%d is incomplete" % (url, *byte_range))
+
+
+def _download_stream(url, part_file, timeout, connections):
+    with connections:
+        with _request(url, timeout) as response, open(part_file, "wb") as f:
+            for block in iter(lambda: response.read(READ_SIZE), b""):
+                f.write(block)
+
+
+def download_file(
+    url: str,
+    file: str,
+    num_connections=4,
+    checksum: str = None,
+    part_size=PART_SIZE,
+    timeout=60.0,
+    connections: threading.BoundedSemaphore = None,
+    verbose=False,
+) -> str:
+    """
+    servers without range-support are downloaded with a single connection and
+    can not be resumed
+    :param connections: limits connections across several downloads,
+        see download_files
+    """
+    if os.path.isfile(file):
+        if checksum is not None:
+            verify_checksum(file, checksum)
+        return file
+    if connections is None:
+        connections = threading.BoundedSemaphore(num_connections)
+
+    part_file = file + ".part"
+    state_file = part_file + ".json"
+    with connections:
+        size = _probe(url, timeout)
+    if size is not None and size > 0:
+        state = _RangeState(state_file, url, size, part_size)
+        if (
+            not os.path.isfile(part_file)
+            or os.path.getsize(part_file) != size
+            or len(state.state["done"]) == 0
+        ):
+            state.reset()
+            with open(part_file, "wb") as f:
+                f.truncate(size)
+        parts = state.parts_todo()
+        if verbose:
+            print(
+                "%s: downloading %d of %d bytes" % (url, len(parts) * part_size, size)
+            )
+
+        def download_part(byte_range):
+            _download_range(url, part_file, byte_range, timeout, connections)
+            state.mark_done(byte_range[0])
+
+        with cf.ThreadPoolExecutor(max_workers=num_connections) as executor:
+            list(executor.map(download_part, parts))
+    else:
+        _download_stream(url, part_file, timeout, connections)
+
+    if checksum is not None:
+        try:
+            verify_checksum(part_file, checksum)
+        except ValueError:
+            for f in [part_file, state_file]:  # corrupt, start from scratch next time
+                if os.path.isfile(f):
+                    os.remove(f)
+            raise
+    os.replace(part_file, file)
+    if os.path.isfile(state_file):
+        os.remove(state_file)
+    return file
+
+
+def download_files(
+    urls: List[str],
+    folder: str,
+    max_connections=8,
+    connections_per_file=4,
+    checksums: Dict[str, str] = None,
+    verbose=False,
+) -> List[str]:
+    """
+    downloads files in parallel, at most max_connections requests at a time
+    :param checksums: url -> "<algorithm>:<hexdigest>"
+    """
+    os.makedirs(folder, exist_ok=True)
+    checksums = checksums if checksums is not None else {}
+    connections = threading.BoundedSemaphore(max_connections)
+
+    def download(url):
+        file = os.path.join(folder, url.split("/")[-1])
+        return download_file(
+            url,
+            file,
+            connections_per_file,
+            checksums.get(url),
+            connections=connections,
+            verbose=verbose,
+        )
+
+    with cf.ThreadPoolExecutor(max_workers=max_connections) as executor:
+        return list(executor.map(download, urls))
@@ -0,0 +1,158 @@
+"""
+registry of json-codecs, the stdlib-json is the default, faster backends (orjson,
+ujson) are registered if installed and have to be chosen by name
+every codec encodes to and decodes from utf-8 bytes, so there is no str round-trip
+
+the fast backends are not lossless: records they cannot encode (tuple-keys, ints
+above 64 bits) are encoded by the stdlib-json instead and lines with NaN/Infinity
+they cannot decode are decoded by it, but orjson writes NaN/Infinity as null and
+decodes ints above 64 bits as floats, ujson writes non-str keys as their str()
+where the stdlib-json skips them
+"""
+import json
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec(NamedTuple):
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+    join_batch: bool = False
+
+    def loads_batch(self, lines: List[bytes]) -> List[Any]:
+        """
+        join_batch: decode many lines with a single call by parsing them as one
+        json-array, pays off for the stdlib-json where the per-call overhead dominates
+        """
+        if len(lines) == 0:
+            return []
+        if self.join_batch:
+            try:
+                records = self.loads(b"[" + b",".join(lines) + b"]")
+            except ValueError:
+                records = None
+            # a line like {"a":1}, {"b":2} parses as two records when joined
+            if records is not None and len(records) == len(lines):
+                return records
+        return [self.loads(l) for l in lines]
+
+
+CODECS: Dict[str, JsonCodec] = {}
+DEFAULT_CODEC = "json"
+
+
+def register_codec(codec: JsonCodec):
+    CODECS[codec.name] = codec
+
+
+def get_codec(name: str = None) -> JsonCodec:
+    """
+    :param name: None selects DEFAULT_CODEC
+    """
+    if name is None:
+        name = DEFAULT_CODEC
+    if name not in CODECS:
+        raise ValueError(
+            "json-codec %s is not available, choose from %s" % (name, list(CODECS))
+        )
+    return CODECS[name]
+
+
+def _stdlib_dumps(d) -> bytes:
+    return json.dumps(d, skipkeys=True, ensure_ascii=False).encode("utf-8")
+
+
+def _with_stdlib_fallback(dumps: Callable[[Any], bytes]) -> Callable[[Any], bytes]:
+    def dumps_or_fallback(d) -> bytes:
+        try:
+            return dumps(d)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(d)
+
+    return dumps_or_fallback
+
+
+def _with_stdlib_loads_fallback(loads: Callable[[bytes], Any]):
+    def loads_or_fallback(line: bytes):
+        try:
+            return loads(line)
+        except ValueError:  # like NaN written by the stdlib-json
+            return json.loads(line)
+
+    return loads_or_fallback
+
+
+register_codec(JsonCodec("json", _stdlib_dumps, json.loads, join_batch=True))
+if ujson is not None:
+    register_codec(
+        JsonCodec(
+            "ujson",
+            _with_stdlib_fallback(
+                lambda d: ujson.dumps(
+                    d, ensure_ascii=False, escape_forward_slashes=False
+                ).encode("utf-8")
+            ),
+            ujson.loads,
+        )
+    )
+if orjson is not None:
+    register_codec(
+        JsonCodec(
+            "orjson",
+            _with_stdlib_fallback(
+                lambda d: orjson.dumps(d, option=orjson.OPT_NON_STR_KEYS)
+            ),
+            _with_stdlib_loads_fallback(orjson.loads),
+        )
+    )
+
+
+def benchmark_codecs(data: List[Dict], batch_size=1024):
+    def timeit(fun):
+        start = time()
+        fun()
+        return len(data) / (time() - start)
+
+    result = {}
+    for name, codec in CODECS.items():
+        lines = [codec.dumps(d) for d in data]
+        batches = [lines[k : k + batch_size] for k in range(0, len(lines), batch_size)]
+        result[name] = {
+            "dumps": timeit(lambda: [codec.dumps(d) for d in data]),
+            "loads": timeit(lambda: [codec.loads(l) for l in lines]),
+            "loads_batch": timeit(lambda: [codec.loads_batch(b) for b in batches]),
+        }
+    return result
+
+
+if __name__ == "__main__":
+    import random
+
+    def build_record(k):
+        return {
+            "id": "doc-%d" % k,
+            "text": " ".join(
+                random.choice(["über", "data", "foo"]) for _ in range(150)
+            ),
+            "lang": random.choice(["de", "en"]),
+            "scores": [random.random() for _ in range(20)],
+            "meta": {"source": "crawl", "tokens": random.randint(0, 1000)},
+        }
+
+    data = [build_record(k) for k in range(50_000)]
+    for name, speeds in benchmark_codecs(data).items():
+        print(
+            "%s: %s"
+            % (name, ", ".join("%s: %d records/s" % kv for kv in speeds.items()))
+        )
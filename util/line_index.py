@@ -0,0 +1,174 @@
+"""
+sidecar line-index (file + ".idx") that maps every step-th line to a byte offset,
+so that skipping lines does not need to read (and decompress) everything before them
+
+for gzip-files the offsets point into the compressed stream, at these positions the
+writer did a zlib.Z_FULL_FLUSH, therefore decompression can restart there without
+knowing anything that came before, this is why gzip-files can only be indexed while
+writing them
+"""
+import gzip
+import io
+import json
+import os
+import zlib
+from typing import Dict, Optional
+
+INDEX_SUFFIX = ".idx"
+CHUNK_SIZE = 64 * 1024
+
+
+def index_file_of(file: str):
+    return file + INDEX_SUFFIX
+
+
+def file_signature(file: str):
+    stat = os.stat(file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _is_gzip(file: str):
+    return file.endswith("gz")
+
+
+def write_line_index(file: str, step: int, num_lines: int, offsets):
+    """
+    :param offsets: offsets[k] is the byte-offset of line (k+1)*step
+    """
+    index = {"step": step, "num_lines": num_lines, "offsets": offsets}
+    index.update(file_signature(file))
+    with open(index_file_of(file), "w") as f:
+        json.dump(index, f)
+
+
+def load_line_index(file: str) -> Optional[Dict]:
+    """
+    :return: None if there is no index or if it does not belong to the current
+        version of the file (size or modification-time changed)
+    """
+    idx_file = index_file_of(file)
+    if not os.path.isfile(idx_file):
+        return None
+    with open(idx_file, "r") as f:
+        index = json.load(f)
+    signature = file_signature(file)
+    if any(index.get(k) != v for k, v in signature.items()):
+        return None
+    return index
+
+
+def build_line_index(file: str, step=1000):
+    if _is_gzip(file):
+        raise ValueError("%s: gzip-files can only be indexed while writing them" % file)
+    offsets = []
+    num_lines = 0
+    with open(file, "rb") as f:
+        for line in iter(f.readline, b""):
+            num_lines += 1
+            if num_lines % step == 0:
+                offsets.append(f.tell())
+    write_line_index(file, step, num_lines, offsets)
+
+
+class IndexedLineWriter(object):
+    """
+    writes byte-lines (including the newline) and builds the line-index on the fly
+    """
+
+    def __init__(self, file: str, step=1000, mode="wb") -> None:
+        assert mode == "wb", "only overwriting is supported when indexing"
+        self.file = file
+        self.step = step
+        self.num_lines = 0
+        self.offsets = []
+
+    def __enter__(self):
+        self.raw = open(self.file, mode="wb")
+        if _is_gzip(self.file):
+            self.f = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        else:
+            self.f = self.raw
+        return self
+
+    def write(self, line: bytes):
+        self.f.write(line)
+        self.num_lines += 1
+        if self.num_lines % self.step == 0:
+            if self.f is not self.raw:
+                self.f.flush(zlib.Z_FULL_FLUSH)
+            self.offsets.append(self.raw.tell())
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.f is not self.raw:
+            self.f.close()
+        self.raw.close()
+        if exc_type is None:
+            write_line_index(self.file, self.step, self.num_lines, self.offsets)
+
+
+class _DeflateReader(io.RawIOBase):
+    """
+    decompresses a gzip-file starting at a full-flush point, following gzip-members
+    (if any) are read by an ordinary GzipFile
+    """
+
+    def __init__(self, fileobj, offset: int) -> None:
+        super().__init__()
+        fileobj.seek(offset)
+        self.fileobj = fileobj
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.buffer = b""
+        self.buffer_pos = 0
+        self.following_members = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.buffer_pos == len(self.buffer):
+            if self.following_members is not None:
+                return self.following_members.readinto(b)
+            elif self.decompressor.eof:
+                unused = len(self.decompressor.unused_data)
+                trailer_len = 8  # crc32 and size
+                self.fileobj.seek(self.fileobj.tell() - unused + trailer_len)
+                self.following_members = gzip.GzipFile(fileobj=self.fileobj)
+            else:
+                chunk = self.fileobj.read(CHUNK_SIZE)
+                if len(chunk) == 0:
+                    raise EOFError("compressed file ended unexpectedly")
+                self.buffer = self.decompressor.decompress(chunk)
+                self.buffer_pos = 0
+        n = min(len(b), len(self.buffer) - self.buffer_pos)
+        b[:n] = self.buffer[self.buffer_pos : self.buffer_pos + n]
+        self.buffer_pos += n
+        return n
+
+    def close(self):
+        if self.following_members is not None:
+            self.following_members.close()
+        self.fileobj.close()
+        super().close()
+
+
+def open_at_line(file: str, line_num: int, index: Dict):
+    """
+    :return: binary file-object positioned at the closest indexed line before
+        line_num and the number of lines that still need to be skipped
+    """
+    checkpoint = min(line_num // index["step"], len(index["offsets"]))
+    if checkpoint == 0:
+        f = gzip.open(file, mode="rb") if _is_gzip(file) else open(file, mode="rb")
+        return f, line_num
+
+    offset = index["offsets"][checkpoint - 1]
+    if _is_gzip(file):
+        f = io.BufferedReader(_DeflateReader(open(file, mode="rb"), offset))
+    else:
+        f = open(file, mode="rb")
+        f.seek(offset)
+    return f, line_num - checkpoint * index["step"]
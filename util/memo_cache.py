@@ -0,0 +1,214 @@
+"""
+content-addressed memoization: results are keyed by hash_list_of_strings over the
+function-identity and fingerprints of the arguments, they are kept in an in-memory
+LRU and on disk (numpy-arrays as .npy, csr-matrices as .npz, anything else pickled)
+disk-writes are atomic (temp-file + os.replace) so several WorkerPool-processes
+can share one cache-folder
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from util.util_methods import hash_list_of_strings
+
+SUFFIXES = [".npy", ".csr.npz", ".pkl"]
+
+
+def fingerprint(x) -> str:
+    """
+    stable (across processes and runs) string-representation of x
+    """
+    if isinstance(x, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(x).tobytes()).hexdigest()
+        return "ndarray(%s,%s,%s)" % (x.dtype.str, x.shape, digest)
+    elif isinstance(x, csr_matrix):
+        parts = [x.data, x.indices, x.indptr, np.asarray(x.shape)]
+        return "csr(%s)" % ",".join(fingerprint(p) for p in parts)
+    elif isinstance(x, dict):
+        items = sorted((fingerprint(k), fingerprint(v)) for k, v in x.items())
+        return "{%s}" % ",".join("%s:%s" % kv for kv in items)
+    elif isinstance(x, (list, tuple)):
+        return "%s[%s]" % (type(x).__name__, ",".join(fingerprint(v) for v in x))
+    elif isinstance(x, (set, frozenset)):  # iteration-order depends on str-hashes
+        return "%s{%s}" % (type(x).__name__, ",".join(sorted(map(fingerprint, x))))
+    elif x is None or isinstance(x, (str, bytes, bool, int, float)):
+        return repr(x)
+    else:
+        return "pickle(%s)" % hashlib.sha1(pickle.dumps(x)).hexdigest()
+
+
+class MemoCache(object):
+    def __init__(
+        self, folder: str, max_bytes=10 * 1024**3, max_memory_items=128
+    ) -> None:
+        """
+        :param max_bytes: if the disk-tier grows above, least recently used
+            entries are removed
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_memory_items = max_memory_items
+        self._init_memory_tier()
+        os.makedirs(folder, exist_ok=True)
+        self.disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _init_memory_tier(self):
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["memory"], state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_memory_tier()
+
+    def key_of(self, fun: Callable, args: Tuple, kwargs: dict) -> str:
+        fun_id = "%s.%s" % (fun.__module__, fun.__qualname__)
+        return hash_list_of_strings([fun_id, fingerprint(args), fingerprint(kwargs)])
+
+    def _file(self, key: str, suffix: str) -> str:
+        return os.path.join(self.folder, key[:2], key + suffix)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        :return: (found, value)
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return True, self.memory[key]
+        for suffix in SUFFIXES:
+            file = self._file(key, suffix)
+            try:
+                value = self._load(file, suffix)
+            except FileNotFoundError:
+                continue
+            try:
+                os.utime(file)  # modification-time is used as last-access for eviction
+            except FileNotFoundError:  # evicted by another process since loading
+                pass
+            self._remember(key, value)
+            return True, value
+        return False, None
+
+    def put(self, key: str, value):
+        self._remember(key, value)
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            suffix = ".npy"
+        elif isinstance(value, csr_matrix):
+            suffix = ".csr.npz"
+        else:
+            suffix = ".pkl"
+        file = self._file(key, suffix)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(file), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._dump(f, value, suffix)
+            os.replace(tmp_file, file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        self.disk_bytes += os.path.getsize(file)
+        if self.disk_bytes > self.max_bytes:
+            self.evict()
+
+    def _remember(self, key: str, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_items:
+                self.memory.popitem(last=False)
+
+    @staticmethod
+    def _dump(f, value, suffix: str):
+        if suffix == ".npy":
+            np.save(f, value, allow_pickle=False)
+        elif suffix == ".csr.npz":
+            np.savez(
+                f,
+                data=value.data,
+                indices=value.indices,
+                indptr=value.indptr,
+                shape=np.asarray(value.shape),
+            )
+        else:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(file: str, suffix: str):
+        if suffix == ".npy":
+            return np.load(file, allow_pickle=False)
+        elif suffix == ".csr.npz":
+            with np.load(file, allow_pickle=False) as z:
+                return csr_matrix(
+                    (z["data"], z["indices"], z["indptr"]), shape=tuple(z["shape"])
+                )
+        else:
+            with open(file, "rb") as f:
+                return pickle.load(f)
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if any(name.endswith(s) for s in SUFFIXES):
+                    file = os.path.join(root, name)
+                    try:
+                        stat = os.stat(file)
+                    except FileNotFoundError:  # evicted by another process
+                        continue
+                    yield file, stat.st_mtime, stat.st_size
+
+    def evict(self, target_fraction=0.9):
+        """
+        removes least recently used entries until the disk-tier is below
+        target_fraction * max_bytes
+        """
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        self.disk_bytes = sum(size for _, _, size in entries)
+        for file, _, size in entries:
+            if self.disk_bytes <= target_fraction * self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            self.disk_bytes -= size
+
+
+def memoize(
+    folder: str = None, cache: MemoCache = None, **cache_kwargs
+) -> Callable[[Callable], Callable]:
+    """
+    decorator, usage:
+        @memoize("/tmp/feature_cache")
+        def extract_features(texts): ...
+    """
+    assert (folder is None) != (cache is None)
+    cache = cache if cache is not None else MemoCache(folder, **cache_kwargs)
+
+    def decorator(fun: Callable):
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            key = cache.key_of(fun, args, kwargs)
+            found, value = cache.get(key)
+            if not found:
+                value = fun(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -6,9 +6,6 @@ import torch
 from util.worker_pool import WorkerPool, Task
 from torch import multiprocessing
 
-multiprocessing.set_start_method(
-    "spawn", force=True
-)  # needs to be done to get CUDA working
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
@@ -37,7 +34,8 @@ class MinimalTask(Task):
 
     def __call__(self, data):
         eid, datum = data
-        with multiprocessing.Pool(processes=3) as p:
+        # CUDA does not work in forked processes
+        with multiprocessing.get_context("spawn").Pool(processes=3) as p:
             result = list(
                 p.imap_unordered(
                     funfun,
@@ -53,7 +51,12 @@ class MinimalTask(Task):
 
 if __name__ == "__main__":
     data = [(x, 3 - x) for x in range(3)]
-    with WorkerPool(processes=2, task=MinimalTask("some-param"), daemons=False) as p:
+    with WorkerPool(
+        processes=2,
+        task=MinimalTask("some-param"),
+        daemons=False,
+        start_method="spawn",
+    ) as p:
         x = p.process(data)
     print(len(x))
     pprint(x)
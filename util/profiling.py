@@ -0,0 +1,204 @@
+"""
+lightweight profiling of pipeline-stages, wrap iterables (read_jsonl, process_batchwise,
+WorkerPool.process_unordered, ...) or functions to see which stage is the bottleneck
+
+for a wrapped iterable the time spent inside next() is work of the stage plus waiting
+on its upstream, the time between handing out an item and being asked for the next
+one is time the stage is blocked on its downstream consumer
+if the upstream stage is wrapped as well (name it via upstream=), its share is
+subtracted to get the self-time of the stage
+"""
+import functools
+import json
+import random
+import sys
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+NUM_LATENCY_SAMPLES = 10_000
+
+
+class StageStats(object):
+    def __init__(self, name: str, upstream: str = None) -> None:
+        self.name = name
+        self.upstream = upstream
+        self.count = 0
+        self.num_bytes = 0
+        self.inside = 0.0  # seconds in next() or in the function-call
+        self.outside = 0.0  # seconds between items/calls
+        self.start = None
+        self.end = None
+        self.latencies = []  # reservoir-sample
+
+    def record(self, start: float, end: float, num_bytes: int):
+        if self.start is None:
+            self.start = start
+        self.end = end
+        latency = end - start
+        self.inside += latency
+        self.num_bytes += num_bytes
+        self.count += 1
+        if len(self.latencies) < NUM_LATENCY_SAMPLES:
+            self.latencies.append(latency)
+        else:
+            k = random.randrange(self.count)
+            if k < NUM_LATENCY_SAMPLES:
+                self.latencies[k] = latency
+
+    def summary(self, stages: Dict[str, "StageStats"]) -> Dict[str, Any]:
+        wall = self.end - self.start if self.count > 0 else 0.0
+        upstream = stages.get(self.upstream)
+        blocked_upstream = upstream.inside if upstream is not None else None
+        self_time = (
+            self.inside - blocked_upstream if upstream is not None else self.inside
+        )
+        if len(self.latencies) > 0:
+            p50, p90, p99 = np.percentile(self.latencies, [50, 90, 99]).tolist()
+        else:
+            p50 = p90 = p99 = None
+        return {
+            "items": self.count,
+            "items_per_s": self.count / wall if wall > 0 else None,
+            "bytes_per_s": self.num_bytes / wall if wall > 0 else None,
+            "latency_p50": p50,
+            "latency_p90": p90,
+            "latency_p99": p99,
+            "wall_s": wall,
+            "self_s": self_time,
+            "blocked_upstream_s": blocked_upstream,
+            "blocked_downstream_s": self.outside,
+        }
+
+
+class Profiler(object):
+    """
+    usage:
+        profiler = Profiler(report_every=10)
+        lines = profiler.iterable("read", read_jsonl(file))
+        tokenized = process_batchwise(tokenize, lines)
+        tokenized = profiler.iterable("tokenize", tokenized, upstream="read")
+        ...
+        profiler.dump("profile.json")
+    """
+
+    def __init__(
+        self, report_every: float = None, report_fun: Callable[[str], Any] = None
+    ) -> None:
+        """
+        :param report_every: seconds, None disables periodic reports
+        :param report_fun: receives the report as json-string, defaults to
+            printing to stderr
+        """
+        self.stages: Dict[str, StageStats] = {}
+        self.report_every = report_every
+        self.report_fun = (
+            report_fun
+            if report_fun is not None
+            else lambda s: print(s, file=sys.stderr)
+        )
+        self.last_report = perf_counter()
+
+    def _stage(self, name: str, upstream: str = None) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, upstream)
+        return self.stages[name]
+
+    def _maybe_report(self, now: float):
+        if self.report_every is not None and now - self.last_report > self.report_every:
+            self.last_report = now
+            self.report()
+
+    def iterable(
+        self,
+        name: str,
+        data: Iterable,
+        upstream: str = None,
+        size_fun: Callable[[Any], int] = None,
+    ) -> Iterator:
+        """
+        :param size_fun: for bytes/s, like len for lines
+        """
+        stats = self._stage(name, upstream)
+        data_iter = iter(data)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(data_iter)
+            except StopIteration:
+                break
+            end = perf_counter()
+            stats.record(start, end, size_fun(item) if size_fun is not None else 0)
+            yield item
+            now = perf_counter()
+            stats.outside += now - end
+            self._maybe_report(now)
+
+    def function(
+        self, name: str, size_fun: Callable[[Any], int] = None
+    ) -> Callable[[Callable], Callable]:
+        """
+        decorator, every call is an item, size_fun is applied to the result
+        """
+
+        def decorator(fun: Callable):
+            stats = self._stage(name)
+
+            @functools.wraps(fun)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                if stats.end is not None:
+                    stats.outside += start - stats.end
+                result = fun(*args, **kwargs)
+                end = perf_counter()
+                num_bytes = size_fun(result) if size_fun is not None else 0
+                stats.record(start, end, num_bytes)
+                self._maybe_report(end)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: s.summary(self.stages) for name, s in self.stages.items()}
+
+    def bottleneck(self) -> Optional[str]:
+        """
+        :return: stage with the most self-time
+        """
+        summary = self.summary()
+        if len(summary) == 0:
+            return None
+        return max(summary, key=lambda name: summary[name]["self_s"])
+
+    def report(self):
+        self.report_fun(json.dumps(self.summary()))
+
+    def dump(self, file: str):
+        with open(file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+if __name__ == "__main__":
+    from time import sleep
+
+    profiler = Profiler(report_every=0.5)
+
+    @profiler.function("square")
+    def square(x):
+        sleep(0.001)
+        return x * x
+
+    def numbers():
+        for k in range(500):
+            sleep(0.002)
+            yield k
+
+    g = profiler.iterable("produce", numbers())
+    g = profiler.iterable("map", (square(x) for x in g), upstream="produce")
+    for x in profiler.iterable("consume", g, upstream="map"):
+        sleep(0.0005)
+    print(json.dumps(profiler.summary(), indent=2))
+    print("bottleneck: %s" % profiler.bottleneck())
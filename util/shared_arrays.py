@@ -0,0 +1,154 @@
+"""
+transport of numpy-arrays (and the components of csr-matrices) via
+multiprocessing.shared_memory: share replaces arrays in (nested) lists, tuples and
+dicts by small descriptors that can be pickled cheaply, attach turns them back into
+arrays that are zero-copy views on the shared-memory blocks
+
+lifecycle: the process that shares closes its handles, the segments live on until
+the receiving process unlinks them (see release), names of segments that were never
+received can be unlinked via unlink
+"""
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+MIN_BYTES = 64 * 1024  # smaller arrays are simply pickled
+
+
+class SharedArray(NamedTuple):
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SharedCSR(NamedTuple):
+    data: SharedArray
+    indices: SharedArray
+    indptr: SharedArray
+    shape: Tuple[int, int]
+
+
+def _share_array(x: np.ndarray, blocks: List[SharedMemory]) -> SharedArray:
+    block = SharedMemory(create=True, size=max(1, x.nbytes))
+    blocks.append(block)
+    np.ndarray(x.shape, dtype=x.dtype, buffer=block.buf)[...] = x
+    return SharedArray(block.name, x.shape, x.dtype.str)
+
+
+def share(obj, blocks: List[SharedMemory], min_bytes=MIN_BYTES):
+    """
+    :param blocks: created shared-memory blocks are appended
+    :return: obj with arrays of at least min_bytes replaced by descriptors
+    """
+    if isinstance(obj, np.ndarray) and obj.dtype != object and obj.nbytes >= min_bytes:
+        return _share_array(obj, blocks)
+    elif isinstance(obj, csr_matrix) and obj.data.nbytes >= min_bytes:
+        return SharedCSR(
+            _share_array(obj.data, blocks),
+            _share_array(obj.indices, blocks),
+            _share_array(obj.indptr, blocks),
+            obj.shape,
+        )
+    elif isinstance(obj, list):
+        return [share(x, blocks, min_bytes) for x in obj]
+    elif isinstance(obj, tuple) and hasattr(obj, "_fields"):  # NamedTuple
+        return type(obj)(*[share(x, blocks, min_bytes) for x in obj])
+    elif isinstance(obj, tuple):
+        return tuple(share(x, blocks, min_bytes) for x in obj)
+    elif isinstance(obj, dict):
+        return {k: share(v, blocks, min_bytes) for k, v in obj.items()}
+    else:
+        return obj
+
+
+def _attach_array(d: SharedArray, blocks: List[SharedMemory], copy: bool):
+    block = SharedMemory(name=d.name)
+    blocks.append(block)
+    x = np.ndarray(d.shape, dtype=np.dtype(d.dtype), buffer=block.buf)
+    return x.copy() if copy else x
+
+
+def attach(obj, blocks: List[SharedMemory], copy=False):
+    """
+    :param blocks: attached shared-memory blocks are appended, with copy=False
+        they must stay open as long as the returned arrays are in use
+    :return: obj with descriptors replaced by arrays
+    """
+    if isinstance(obj, SharedArray):
+        return _attach_array(obj, blocks, copy)
+    elif isinstance(obj, SharedCSR):
+        return csr_matrix(
+            (
+                _attach_array(obj.data, blocks, copy),
+                _attach_array(obj.indices, blocks, copy),
+                _attach_array(obj.indptr, blocks, copy),
+            ),
+            shape=obj.shape,
+            copy=False,
+        )
+    elif isinstance(obj, list):
+        return [attach(x, blocks, copy) for x in obj]
+    elif isinstance(obj, tuple) and hasattr(obj, "_fields"):
+        return type(obj)(*[attach(x, blocks, copy) for x in obj])
+    elif isinstance(obj, tuple):
+        return tuple(attach(x, blocks, copy) for x in obj)
+    elif isinstance(obj, dict):
+        return {k: attach(v, blocks, copy) for k, v in obj.items()}
+    else:
+        return obj
+
+
+def block_names(obj) -> List[str]:
+    """
+    :return: names of the shared-memory blocks that descriptors in obj refer to
+    """
+    if isinstance(obj, SharedArray):
+        return [obj.name]
+    elif isinstance(obj, SharedCSR):
+        return [obj.data.name, obj.indices.name, obj.indptr.name]
+    elif isinstance(obj, (list, tuple)):
+        return [n for x in obj for n in block_names(x)]
+    elif isinstance(obj, dict):
+        return [n for v in obj.values() for n in block_names(v)]
+    else:
+        return []
+
+
+def release(blocks: List[SharedMemory], unlink: bool):
+    """
+    closes the handles, arrays still viewing a block keep it mapped until they
+    are garbage-collected
+    """
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:  # exported pointers exist
+            pass
+        if unlink:
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def unlink(names: Iterable[str]):
+    for name in names:
+        try:
+            block = SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        release([block], unlink=True)
+
+
+def receive(obj) -> Any:
+    """
+    attaches, copies out and unlinks, for objects that were shared by another
+    process and are not needed there anymore
+    """
+    blocks = []
+    try:
+        return attach(obj, blocks, copy=True)
+    finally:
+        release(blocks, unlink=True)
@@ -1,13 +1,36 @@
+import asyncio
+import concurrent.futures as cf
 import hashlib
 import os
+import signal
 import subprocess
+import sys
+import threading
+import zlib
+from collections import deque
+from itertools import chain, islice
 from time import time
-from typing import Iterable, Generator, List, Dict, Any, TypeVar, Callable
+from typing import (
+    Iterable,
+    Generator,
+    List,
+    Dict,
+    Any,
+    TypeVar,
+    Callable,
+    Sequence,
+    Union,
+    AsyncIterable,
+    Awaitable,
+)
 
 import numpy as np
 from scipy.sparse import csr_matrix, vstack
 
 
+T = TypeVar("T")
+
+
 def insert_or_append(d, k, v):
     if k in d:
         d[k].append(v)
@@ -41,26 +64,319 @@ def set_val(d, path, value):
     d.__setitem__(path[-1], value)
 
 
-def exec_command(command):
+def _drain(stream, name: str, lines: List[bytes], line_callback, errors: List):
+    """
+    an exception of line_callback is put into errors, the stream is still drained
+    (without calling it anymore) so the child does not block on a full pipe
+    """
+    with stream:
+        for line in iter(stream.readline, b""):
+            if line_callback is not None:
+                try:
+                    line_callback(name, line)
+                except BaseException as e:
+                    errors.append(e)
+                    line_callback = None
+            if lines is not None:
+                lines.append(line)
+
+
+def _kill_group(p: subprocess.Popen):
+    try:
+        os.killpg(p.pid, signal.SIGKILL)
+    except ProcessLookupError:  # already gone
+        pass
+    p.wait()
+
+
+def run_command(
+    command: str,
+    line_callback: Callable[[str, bytes], Any] = None,
+    timeout: float = None,
+    collect_output=True,
+) -> Dict[str, Any]:
+    """
+    stdout and stderr are drained by two threads, so a child that fills one pipe
+    while the other is read can not block
+    the command runs in its own process-group, which is killed if waiting for it
+    is interrupted (KeyboardInterrupt), it does not get the terminals SIGINT
+    :param line_callback: called with ("stdout" or "stderr", line) as soon as
+        a line arrives, an exception it raises is re-raised here once the
+        command finished
+    :param timeout: seconds, after which the command (its whole process-group)
+        is killed
+    :return: dict with command, returncode, stdout, stderr (lists of byte-lines,
+        empty if not collect_output), duration and timed_out
+    """
+    start = time()
     p = subprocess.Popen(
-        command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
     )
-    return {"stdout": p.stdout.readlines(), "stderr": p.stderr.readlines()}
-
-
-def dicts_to_csr(dicts: List[Dict], num_rows=None, num_cols=None):
-    assert isinstance(dicts, list) and len(dicts) > 0
-    assert all([isinstance(d, dict) for d in dicts])
-    g = [(row, int(col), val) for row, d in enumerate(dicts) for col, val in d.items()]
-    col = [t[1] for t in g]
-    values = [t[2] for t in g]
-    row = [t[0] for t in g]
-    num_dim = max(col) + 1
-    shape = (
-        num_rows if num_rows is not None else len(dicts),
-        num_cols if num_cols is not None else num_dim,
-    )
-    return csr_matrix((values, (row, col)), shape=shape)
+    output = {"stdout": [], "stderr": []}
+    errors = []
+    drainers = [
+        threading.Thread(
+            target=_drain,
+            args=(
+                stream,
+                name,
+                output[name] if collect_output else None,
+                line_callback,
+                errors,
+            ),
+            daemon=True,
+        )
+        for name, stream in [("stdout", p.stdout), ("stderr", p.stderr)]
+    ]
+    for t in drainers:
+        t.start()
+    timed_out = False
+    try:
+        p.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        _kill_group(p)
+    except BaseException:
+        _kill_group(p)
+        raise
+    for t in drainers:
+        t.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return {
+        "command": command,
+        "returncode": p.returncode,
+        "stdout": output["stdout"],
+        "stderr": output["stderr"],
+        "duration": time() - start,
+        "timed_out": timed_out,
+    }
+
+
+def run_commands(
+    commands: List[str],
+    max_parallel=4,
+    timeout: float = None,
+    line_callback: Callable[[str, str, bytes], Any] = None,
+    collect_output=True,
+) -> List[Dict[str, Any]]:
+    """
+    runs shell-commands in parallel, at most max_parallel at a time
+    :param timeout: per command
+    :param line_callback: called with (command, "stdout" or "stderr", line)
+    :return: results of run_command in order of commands
+    """
+
+    def run(command):
+        callback = None
+        if line_callback is not None:
+            callback = lambda name, line: line_callback(command, name, line)
+        return run_command(command, callback, timeout, collect_output)
+
+    with cf.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        return list(executor.map(run, commands))
+
+
+def exec_command(command):
+    result = run_command(command)
+    return {"stdout": result["stdout"], "stderr": result["stderr"]}
+
+
+def _grow(array: np.ndarray, min_size: int) -> np.ndarray:
+    if len(array) >= min_size:
+        return array
+    grown = np.empty(max(min_size, 2 * len(array)), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class CSRBuilder(object):
+    """
+    builds a csr_matrix from dicts (column-index -> value) without materializing
+    per-nonzero tuples, rows are collected in chunks that are appended to
+    preallocated numpy-arrays (indptr, indices, data) which grow by doubling
+    """
+
+    def __init__(self, dtype=None, index_dtype=np.int32, chunk_size=10_000) -> None:
+        """
+        :param dtype: of the values, None infers it from the data
+        """
+        self.fixed_dtype = np.dtype(dtype) if dtype is not None else None
+        self.index_dtype = np.dtype(index_dtype)
+        self.chunk_size = chunk_size
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=self.index_dtype)
+        self.data = np.empty(0, dtype=self.fixed_dtype)
+        self.num_rows = 0
+        self.nnz = 0
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self.chunk_cols = []
+        self.chunk_values = []
+        self.chunk_lengths = []
+
+    def add_row(self, d: Dict):
+        self.chunk_cols.extend(d.keys())
+        self.chunk_values.extend(d.values())
+        self.chunk_lengths.append(len(d))
+        if len(self.chunk_lengths) >= self.chunk_size:
+            self._flush_chunk()
+
+    def add_rows(self, dicts: Iterable[Dict]):
+        for d in dicts:
+            self.add_row(d)
+        return self
+
+    def _flush_chunk(self):
+        if len(self.chunk_lengths) == 0:
+            return
+        cols = np.asarray(self.chunk_cols, dtype=self.index_dtype)
+        values = np.asarray(self.chunk_values, dtype=self.fixed_dtype)
+        if (
+            self.fixed_dtype is None
+            and len(values) > 0  # an empty chunk says nothing about the dtype
+            and values.dtype != self.data.dtype
+        ):
+            dtype = np.result_type(self.data, values) if self.nnz else values.dtype
+            self.data = self.data.astype(dtype)
+        nnz = self.nnz + len(cols)
+        num_rows = self.num_rows + len(self.chunk_lengths)
+        self.indices = _grow(self.indices, nnz)
+        self.data = _grow(self.data, nnz)
+        self.indptr = _grow(self.indptr, num_rows + 1)
+        self.indices[self.nnz : nnz] = cols
+        self.data[self.nnz : nnz] = values
+        self.indptr[self.num_rows + 1 : num_rows + 1] = self.nnz + np.cumsum(
+            self.chunk_lengths
+        )
+        self.nnz, self.num_rows = nnz, num_rows
+        self._reset_chunk()
+
+    def build(self, num_rows=None, num_cols=None) -> csr_matrix:
+        self._flush_chunk()
+        indices = self.indices[: self.nnz]
+        num_dim = int(indices.max()) + 1 if self.nnz > 0 else 0
+        shape = (
+            num_rows if num_rows is not None else self.num_rows,
+            num_cols if num_cols is not None else num_dim,
+        )
+        indptr = self.indptr[: self.num_rows + 1]
+        if shape[0] > self.num_rows:  # trailing empty rows
+            indptr = np.concatenate(
+                [indptr, np.full(shape[0] - self.num_rows, self.nnz, dtype=np.int64)]
+            )
+        if self.nnz <= np.iinfo(self.index_dtype).max:
+            indptr = indptr.astype(self.index_dtype)
+        else:
+            indices = indices.astype(np.int64)
+        x = csr_matrix((self.data[: self.nnz], indices, indptr), shape=shape)
+        x.sort_indices()
+        return x
+
+
+def dicts_to_csr(
+    dicts: Iterable[Dict],
+    num_rows=None,
+    num_cols=None,
+    dtype=None,
+    index_dtype=np.int32,
+    chunk_size=10_000,
+):
+    """
+    :param dicts: list or generator of dicts, keys are (convertible to) int
+    """
+    builder = CSRBuilder(dtype, index_dtype, chunk_size).add_rows(dicts)
+    assert builder.num_rows + len(builder.chunk_lengths) > 0
+    return builder.build(num_rows, num_cols)
+
+
+class FeatureVocabulary(object):
+    """
+    maps string-keys of feature-dicts to column-indices, either learned by fit
+    (unknown keys are added until freeze is called, afterwards they are dropped)
+    or stateless by feature-hashing if num_features is given
+    plain attributes only, so it can be pickled and send to WorkerPool-workers
+    """
+
+    def __init__(self, num_features: int = None) -> None:
+        self.num_features = num_features
+        self.key2idx: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.frozen = num_features is not None
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)  # unpickled strings are not interned anymore
+        self.names = [sys.intern(k) for k in self.names]
+        self.key2idx = {k: i for i, k in enumerate(self.names)}
+
+    @property
+    def is_hashing(self):
+        return self.num_features is not None
+
+    def __len__(self):
+        return self.num_features if self.is_hashing else len(self.names)
+
+    def _add(self, key: str) -> int:
+        key = sys.intern(key)
+        self.key2idx[key] = len(self.names)
+        self.names.append(key)
+        return self.key2idx[key]
+
+    def index(self, key: str):
+        """
+        :return: None for unknown keys of a frozen vocabulary
+        """
+        if self.is_hashing:
+            return zlib.crc32(key.encode("utf-8")) % self.num_features
+        idx = self.key2idx.get(key)
+        if idx is None and not self.frozen:
+            idx = self._add(key)
+        return idx
+
+    def fit(self, dicts: Iterable[Dict[str, Any]]):
+        assert not self.frozen
+        for d in dicts:
+            for key in d.keys():
+                if key not in self.key2idx:
+                    self._add(key)
+        return self
+
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def _to_idx_dict(self, d: Dict[str, Any]) -> Dict[int, Any]:
+        if not self.is_hashing:
+            key2idx = self.key2idx
+            if self.frozen:
+                return {key2idx[k]: v for k, v in d.items() if k in key2idx}
+            elif all(k in key2idx for k in d.keys()):
+                return {key2idx[k]: v for k, v in d.items()}
+        idx_dict = {}
+        for k, v in d.items():
+            idx = self.index(k)
+            if idx is not None:
+                idx_dict[idx] = idx_dict.get(idx, 0) + v  # hash-collisions add up
+        return idx_dict
+
+    def transform(self, dicts: Iterable[Dict[str, Any]], dtype=None) -> csr_matrix:
+        """
+        one pass from string-keyed dicts to csr_matrix, an unfrozen vocabulary
+        learns new keys on the way
+        """
+        builder = CSRBuilder(dtype).add_rows(self._to_idx_dict(d) for d in dicts)
+        return builder.build(num_cols=len(self))
+
+    def inverse_transform(self, x: csr_matrix, lazy=False):
+        """
+        hashed features can not be mapped back, their keys stay column-indices
+        """
+        return csr_to_dicts(x, None if self.is_hashing else self.names, lazy)
 
 
 def merge_dicts(dicts: Iterable):
@@ -71,67 +387,238 @@ def merge_dicts(dicts: Iterable):
     return result
 
 
-def csr_vectors_to_dicts(vects: List[csr_matrix]):
+class RowDicts(Sequence):
+    """
+    rows of a sparse structure (csr-like indptr, column-indices, values) as dicts,
+    a dict is only built when its row is accessed
+    """
+
+    def __init__(
+        self, indptr: np.ndarray, cols: np.ndarray, values: np.ndarray, dim_names=None
+    ) -> None:
+        self.indptr = indptr
+        self.cols = cols
+        self.values = values
+        self.dim_names = dim_names
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def _build(self, cols: List[int], values: List) -> Dict:
+        if self.dim_names is not None:
+            cols = [self.dim_names[c] for c in cols]
+        return dict(zip(cols, values))
+
+    def __getitem__(self, row_idx):
+        if isinstance(row_idx, slice):
+            return [self[k] for k in range(*row_idx.indices(len(self)))]
+        if row_idx < 0:
+            row_idx += len(self)
+        if not 0 <= row_idx < len(self):
+            raise IndexError(row_idx)
+        start, end = self.indptr[row_idx], self.indptr[row_idx + 1]
+        return self._build(
+            self.cols[start:end].tolist(), self.values[start:end].tolist()
+        )
+
+    def to_list(self) -> List[Dict]:
+        indptr = self.indptr.tolist()
+        cols, values = self.cols.tolist(), self.values.tolist()
+        return [
+            self._build(cols[start:end], values[start:end])
+            for start, end in zip(indptr[:-1], indptr[1:])
+        ]
+
+
+def csr_vectors_to_dicts(vects: List[csr_matrix], lazy=False):
     csr = vstack(vects, format="csr")
-    return csr_to_dicts(csr)
-
-
-def ndarray_to_dicts(x: np.ndarray, dim_names=None, filter_on_val=lambda v: True):
-    if dim_names is None:
-        dim_names = [i for i in range(x.shape[1])]
-    return [
-        {dim_names[col]: val for col, val in enumerate(row) if filter_on_val(val)}
-        for row in x
-    ]
-
+    return csr_to_dicts(csr, lazy=lazy)
+
+
+def _mask_of(x: np.ndarray, filter_on_val) -> np.ndarray:
+    """
+    filter_on_val is applied to the whole array if it supports that
+    (like lambda v: v > 0), else it is called per value
+    a scalar result of the whole-array call (like from lambda v: v is not None)
+    says nothing about the single values, so it falls back to per value as well
+    """
+    if filter_on_val is None:
+        return np.ones(x.shape, dtype=bool)
+    try:
+        mask = filter_on_val(x)
+    except Exception:
+        mask = None
+    if isinstance(mask, np.ndarray) and mask.shape == x.shape:
+        return mask.astype(bool)
+    else:
+        return np.vectorize(filter_on_val, otypes=[bool])(x)
+
+
+def ndarray_to_dicts(x: np.ndarray, dim_names=None, filter_on_val=None, lazy=False):
+    """
+    :param filter_on_val: keeps only values for which it is true, None keeps all
+    """
+    mask = _mask_of(x, filter_on_val)
+    rows, cols = np.nonzero(mask)
+    indptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+    dicts = RowDicts(indptr, cols, x[rows, cols], dim_names)
+    return dicts if lazy else dicts.to_list()
+
+
+def csr_to_dicts(x: csr_matrix, dim_names=None, lazy=False):
+    """
+    explicitly stored zeros are dropped, as x.nonzero() does
+    :param lazy: return a RowDicts-sequence that builds the dicts on access
+    """
+    if not x.has_canonical_format or (x.data == 0).any():
+        x = x.copy()
+        x.sum_duplicates()
+        x.eliminate_zeros()
+    dicts = RowDicts(x.indptr, x.indices, x.data, dim_names)
+    return dicts if lazy else dicts.to_list()
+
+
+class AdaptiveBatchSize(object):
+    """
+    pass it as batch_size to process_batchwise/consume_batchwise, it measures the
+    per-batch latency and moves the batch-size multiplicatively (at most by factor 2
+    per batch) towards target_latency (seconds per batch),
+    without target_latency it hill-climbs towards the best throughput (items/s),
+    after every reversal of direction the step-factor shrinks (2, 1.41, 1.19, ...),
+    once it is below 1 + tolerance the batch-size is held
+    """
+
+    def __init__(
+        self,
+        batch_size=1024,
+        target_latency: float = None,
+        min_batch_size=1,
+        max_batch_size=2**16,
+        max_memory: int = None,
+        item_size_fun: Callable[[Any], int] = sys.getsizeof,
+        tolerance=0.1,
+    ) -> None:
+        """
+        :param max_memory: in bytes, caps batch_size * estimated size of an item,
+            already for the first batch
+        :param item_size_fun: estimates the size of an item in bytes,
+            numpy-arrays are measured by nbytes
+        """
+        self.batch_size = batch_size
+        self.target_latency = target_latency
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_memory = max_memory
+        self.item_size_fun = item_size_fun
+        self.tolerance = tolerance
+        self.last_throughput = None
+        self.direction = 1  # grow (1) or shrink (-1)
+        self.step = 2.0
+
+    def batches(self, g: Iterable[T]) -> Generator[List[T], None, None]:
+        """
+        every batch is cut with the batch_size that is current at that moment
+        """
+        if isinstance(g, (list, np.ndarray)):
+            self._cap_to_memory(g[:16])
+            k = 0
+            while k < len(g):
+                yield g[k : k + self.batch_size]
+                k += self.batch_size
+        else:
+            it = iter(g)
+            if self.max_memory is not None:  # peek at the first item
+                first = list(islice(it, 1))
+                self._cap_to_memory(first)
+                it = chain(first, it)
+            for batch in iter(lambda: list(islice(it, self.batch_size)), []):
+                yield batch
 
-def csr_to_dicts(x: csr_matrix, dim_names=None):
-    if dim_names is None:
-        dim_names = [i for i in range(x.shape[1])]
-    vert_idx, horiz_idx = x.nonzero()
-    return [
-        {
-            dim_names[k]: v
-            for k, v in zip(
-                horiz_idx[np.where(vert_idx == row_idx)],
-                x.data[np.where(vert_idx == row_idx)],
+    def _item_size(self, batch) -> float:
+        if isinstance(batch, np.ndarray):
+            return batch.nbytes / max(1, len(batch))
+        sample = batch[:16]
+        return sum(self.item_size_fun(x) for x in sample) / max(1, len(sample))
+
+    def _cap_to_memory(self, sample):
+        if self.max_memory is not None and len(sample) > 0:
+            max_size = self.max_memory / max(1.0, self._item_size(sample))
+            self.batch_size = int(
+                max(self.min_batch_size, min(self.batch_size, max_size))
             )
-        }
-        for row_idx in range(x.shape[0])
-    ]
 
-
-def process_batchwise(process_fun, iterable: Iterable, batch_size=1024):
-    return (
-        d
-        for batch in iterable_to_batches(iterable, batch_size)
-        for d in process_fun(batch)
-    )
-
-
-def consume_batchwise(consume_fun, iterable: Iterable, batch_size=1024):
-    for batch in iterable_to_batches(iterable, batch_size):
-        consume_fun(batch)
-
-
-T = TypeVar("T")
+    def update(self, batch, duration: float):
+        if len(batch) == 0 or len(batch) < self.batch_size:  # last batch
+            return
+        if self.target_latency is not None:
+            factor = self.target_latency / max(duration, 1e-9)
+        elif self.step < 1 + self.tolerance:  # settled
+            factor = 1.0
+        else:
+            throughput = len(batch) / max(duration, 1e-9)
+            if self.last_throughput is not None and throughput < self.last_throughput:
+                self.direction = -self.direction
+                self.step = self.step**0.5
+            self.last_throughput = throughput
+            factor = self.step**self.direction
+        new_size = self.batch_size * min(2.0, max(0.5, factor))
+        if self.max_memory is not None:
+            new_size = min(new_size, self.max_memory / max(1.0, self._item_size(batch)))
+        self.batch_size = int(
+            min(self.max_batch_size, max(self.min_batch_size, new_size))
+        )
+
+
+def _timed_batches(iterable: Iterable, adaptive: AdaptiveBatchSize, fun):
+    for batch in adaptive.batches(iterable):
+        start = time()
+        result = fun(batch)
+        adaptive.update(batch, time() - start)
+        yield result
+
+
+def process_batchwise(
+    process_fun, iterable: Iterable, batch_size: Union[int, AdaptiveBatchSize] = 1024
+):
+    """
+    :param batch_size: fixed or AdaptiveBatchSize, then the results of a batch are
+        materialized as list to measure the time process_fun takes
+    """
+    if isinstance(batch_size, AdaptiveBatchSize):
+        batches_results = _timed_batches(
+            iterable, batch_size, lambda batch: list(process_fun(batch))
+        )
+    else:
+        batches_results = (
+            process_fun(batch) for batch in iterable_to_batches(iterable, batch_size)
+        )
+    return (d for results in batches_results for d in results)
+
+
+def consume_batchwise(
+    consume_fun, iterable: Iterable, batch_size: Union[int, AdaptiveBatchSize] = 1024
+):
+    if isinstance(batch_size, AdaptiveBatchSize):
+        for _ in _timed_batches(iterable, batch_size, consume_fun):
+            pass
+    else:
+        for batch in iterable_to_batches(iterable, batch_size):
+            consume_fun(batch)
 
 
 def iterable_to_batches(
     g: Iterable[T], batch_size: int
 ) -> Generator[List[T], None, None]:
-    g = iter(g) if isinstance(g, list) else g
-    batch = []
-    while True:
-        try:
-            batch.append(next(g))
-            if len(batch) == batch_size:
-                yield batch
-                batch = []
-        except StopIteration as e:  # there is no next element in iterator
-            break
-    if len(batch) > 0:
-        yield batch
+    """
+    lists and numpy-arrays are sliced, for numpy-arrays these slices are views
+    """
+    if isinstance(g, (list, np.ndarray)):
+        for k in range(0, len(g), batch_size):
+            yield g[k : k + batch_size]
+    else:
+        it = iter(g)
+        for batch in iter(lambda: list(islice(it, batch_size)), []):
+            yield batch
 
 
 def hash_list_of_strings(l: List[str]):
@@ -148,15 +635,181 @@ def iterate_and_time(g):
         yield d, time() - start
 
 
-import concurrent.futures as cf
+def _call_and_note_start(process_fun: Callable, datum: Dict, starts: Dict, key):
+    starts[key] = time()
+    return process_fun(**datum)
+
+
+def process_with_threadpool(
+    data: Iterable[Dict],
+    process_fun: Callable,
+    max_workers=1,
+    max_in_flight: int = None,
+    ordered=False,
+    timeout: float = None,
+):
+    """
+    see: https://docs.python.org/3/library/concurrent.futures.html
+    data is consumed lazily, at most max_in_flight items are submitted but not yet
+    yielded, so memory stays flat even for unbounded generators
+    :param max_in_flight: defaults to 2 * max_workers
+    :param ordered: yield results in input-order, early results wait in a
+        reorder-buffer that is bounded by max_in_flight
+    :param timeout: seconds a single item may run, else cf.TimeoutError is raised
+    """
+    max_in_flight = max_in_flight if max_in_flight is not None else 2 * max_workers
+    assert max_in_flight >= 1
+    data_iter = iter(data)
+    starts = {}
+    pending = deque()
+    executor = cf.ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(datum):
+        key = object()
+        future = executor.submit(_call_and_note_start, process_fun, datum, starts, key)
+        pending.append((key, future))
+
+    def check_timeouts():
+        now = time()
+        for key, future in pending:
+            start = starts.get(key)
+            if not future.done() and start is not None and now - start > timeout:
+                raise cf.TimeoutError("item took longer than %0.2f seconds" % timeout)
+
+    def next_done():
+        futures = [pending[0][1]] if ordered else [f for _, f in pending]
+        poll = None if timeout is None else min(timeout, 0.1)
+        while True:
+            done, _ = cf.wait(futures, timeout=poll, return_when=cf.FIRST_COMPLETED)
+            if timeout is not None:  # also while others finish, a stuck one must fail
+                check_timeouts()
+            if len(done) > 0:
+                break
+        k = 0 if ordered else next(i for i, (_, f) in enumerate(pending) if f in done)
+        key, future = pending[k]
+        del pending[k]
+        starts.pop(key, None)
+        return future
+
+    try:
+        for datum in islice(data_iter, max_in_flight):
+            submit(datum)
+        while len(pending) > 0:
+            future = next_done()
+            for datum in islice(data_iter, 1):
+                submit(datum)
+            yield future.result()
+    except BaseException:  # also on GeneratorExit do not wait for running items
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    else:
+        executor.shutdown(wait=True)
 
 
-def process_with_threadpool(data: List[Dict], process_fun: Callable, max_workers=1):
-    """see: https://docs.python.org/3/library/concurrent.futures.html"""
-    with cf.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_sample = [executor.submit(process_fun, **d) for d in data]
-        for future in cf.as_completed(future_to_sample):
-            yield future.result()
+async def _as_async_iterator(data: Union[Iterable, AsyncIterable]):
+    if hasattr(data, "__aiter__"):
+        async for d in data:
+            yield d
+    else:
+        for d in data:
+            yield d
+
+
+async def process_async(
+    data: Union[Iterable[Dict], AsyncIterable[Dict]],
+    process_fun: Callable[..., Awaitable],
+    max_concurrency=100,
+    ordered=False,
+):
+    """
+    asyncio-counterpart of process_with_threadpool: async generator that calls the
+    async process_fun(**datum), at most max_concurrency items are submitted but not
+    yet yielded (which also bounds the concurrent calls), data (sync or async
+    iterable) is only consumed when there is a free slot
+    """
+    pending = deque()
+    finished = asyncio.Queue()  # only used if not ordered
+    data_iter = _as_async_iterator(data)
+
+    async def submit_free_slots():
+        while len(pending) < max_concurrency:
+            try:
+                datum = await data_iter.__anext__()
+            except StopAsyncIteration:
+                return
+            task = asyncio.ensure_future(process_fun(**datum))
+            if not ordered:
+                task.add_done_callback(finished.put_nowait)
+            pending.append(task)
+
+    try:
+        await submit_free_slots()
+        while len(pending) > 0:
+            if ordered:
+                task = pending.popleft()
+                await asyncio.wait([task])
+            else:
+                task = await finished.get()
+                pending.remove(task)
+            await submit_free_slots()
+            yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await data_iter.aclose()
+
+
+def _iterate_async_generator(agen) -> Generator:
+    """
+    drives an async generator from synchronous code with a private event-loop
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+def process_with_asyncio(
+    data: Union[Iterable[Dict], AsyncIterable[Dict]],
+    process_fun: Callable[..., Awaitable],
+    max_concurrency=100,
+    ordered=False,
+):
+    """
+    synchronous generator around process_async, thousands of concurrent
+    I/O-operations within a single thread
+    """
+    yield from _iterate_async_generator(
+        process_async(data, process_fun, max_concurrency, ordered)
+    )
+
+
+def process_batchwise_with_asyncio(
+    process_fun: Callable[[List], Awaitable[Iterable]],
+    iterable: Iterable,
+    batch_size=1024,
+    max_concurrency=10,
+):
+    """
+    asyncio-counterpart of process_batchwise, up to max_concurrency batches are
+    processed concurrently, results keep the input-order
+    """
+
+    async def process_batch(batch):
+        return await process_fun(batch)
+
+    batches = ({"batch": b} for b in iterable_to_batches(iterable, batch_size))
+    for results in process_with_asyncio(
+        batches, process_batch, max_concurrency, ordered=True
+    ):
+        yield from results
 
 
 if __name__ == "__main__":
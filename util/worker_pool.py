@@ -1,17 +1,48 @@
+import multiprocessing as mp
+import os
+import sys
+import threading
 import time
 import traceback
 from abc import abstractmethod
+from collections import deque
 from pprint import pprint
-from typing import Iterable, NamedTuple, Any, Dict
-
-try:
-    from torch import multiprocessing as mp
-
-    mp.set_start_method("spawn", force=True)  # needs to be done to get CUDA working
-    # multiprocessing = None
-
-except ImportError:  # TODO: this is shitty
-    import multiprocessing as mp
+from itertools import count, islice
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection, wait
+from multiprocessing.reduction import ForkingPickler
+from typing import (
+    Iterable,
+    NamedTuple,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Callable,
+    Optional,
+    Tuple,
+)
+
+
+def get_context(start_method: str = None, preload: List[str] = None):
+    """
+    :param start_method: "fork", "forkserver" or "spawn", None chooses "spawn"
+        if CUDA is initialized in this process (can not be forked), else the
+        platforms default
+    :param preload: modules the forkserver imports once, so that workers forked
+        from it do not need to import them again
+    """
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # registers reductions that share tensors between processes
+        import torch.multiprocessing
+
+        if start_method is None and torch.cuda.is_initialized():
+            start_method = "spawn"
+    ctx = mp.get_context(start_method)
+    if ctx.get_start_method() == "forkserver" and preload is not None:
+        ctx.set_forkserver_preload(preload)
+    return ctx
 
 
 class Task(object):
@@ -58,41 +89,117 @@ class GenericTask(Task):
         raise NotImplementedError
 
 
-class Worker(mp.Process):
-    def __init__(
-        self, task_queue: mp.JoinableQueue, result_queue: mp.Queue, task: Task
-    ):
-        mp.Process.__init__(self)
+class Worker(object):
+    """
+    run is the target of a process of the pools context
+    """
+
+    def __init__(self, task_queue: mp.Queue, result_conn: Connection, task: Task):
+        """
+        :param task_queue, result_conn: every worker has its own, a worker that
+            dies while reading from (or writing to) a shared queue would leave its
+            lock acquired and block all others
+        """
         self.task_queue = task_queue
-        self.result_queue = result_queue
+        self.result_conn = result_conn
         self.task: Task = task
 
     def run(self):
-        proc_name = self.name
         with self.task as task:
+            self.result_conn.send(Ready(os.getpid()))
             while True:
-                stuff = self.task_queue.get()
-                if isinstance(stuff, IdWork):
-                    work_id, task_data = stuff.eid, stuff.work
-                else:
-                    work_id, task_data = None, stuff
-
-                if task_data is None:
+                job = self.task_queue.get()
+                if job is None:
                     # Poison pill means shutdown
-                    self.task_queue.task_done()
                     break
-                try:
-                    result = task(task_data)
-                except Exception as e:
-                    traceback.print_exc()
-                    result = None
-
-                self.task_queue.task_done()
-                if work_id is not None:
-                    putit = (work_id, result)
+                # before unpickling, which can kill the worker (OOM) as well
+                self.result_conn.send(Started(os.getpid(), job.key))
+                stuff = ForkingPickler.loads(job.payload)
+                if isinstance(stuff, SharedJob):
+                    putit = self._process_shared(task, stuff)
                 else:
-                    putit = result
-                self.result_queue.put(putit)
+                    putit = self._process_stuff(task, stuff)
+                stuff = None
+                self.result_conn.send(Done(os.getpid(), job.key, putit))
+
+    @classmethod
+    def _process_shared(cls, task: Task, job: "SharedJob") -> "SharedResult":
+        """
+        the task works on zero-copy views of the jobs arrays, arrays in its result
+        are copied into new blocks that the receiving process unlinks
+        """
+        from util import shared_arrays
+
+        blocks = []
+        try:
+            stuff = shared_arrays.attach(job.payload, blocks)
+            result_blocks = []
+            result = shared_arrays.share(cls._process_stuff(task, stuff), result_blocks)
+            shared_arrays.release(result_blocks, unlink=False)
+        except Exception as e:  # blocks are gone, a retried job was already done
+            failure = JobFailure("exception", repr(e), traceback.format_exc(), 1)
+            results = _failure_results(job.payload, failure)
+            result = Chunk(results) if isinstance(job.payload, Chunk) else results[0]
+        finally:
+            stuff = None
+            shared_arrays.release(blocks, unlink=True)
+        return SharedResult(result, job.block_names)
+
+    @classmethod
+    def _process_stuff(cls, task: Task, stuff):
+        if isinstance(stuff, Chunk):
+            return Chunk([cls._process(task, s) for s in stuff.jobs])
+        else:
+            return cls._process(task, stuff)
+
+    @staticmethod
+    def _process(task: Task, stuff):
+        if isinstance(stuff, IdWork):
+            work_id, task_data = stuff.eid, stuff.work
+        else:
+            work_id, task_data = None, stuff
+        try:
+            result = task(task_data)
+        except Exception as e:
+            result = JobFailure("exception", repr(e), traceback.format_exc(), 1)
+        return (work_id, result) if work_id is not None else result
+
+
+class JobFailure(NamedTuple):
+    """
+    returned instead of a result if a job failed
+    kind: "exception" (raised by the task, not retried), "crashed" (worker died)
+        or "timeout" (worker was killed)
+    """
+
+    kind: str
+    message: str
+    traceback: Optional[str]
+    attempts: int
+
+
+class Job(NamedTuple):
+    key: int
+    payload: bytes  # pickled, unpickled by the worker after it sent Started
+
+
+class Ready(NamedTuple):
+    """
+    sent once the task is set up (Task.__enter__ returned)
+    """
+
+    worker: int  # pid
+
+
+class Started(NamedTuple):
+    worker: int  # pid
+    key: int
+
+
+class Done(NamedTuple):
+    worker: int  # pid
+    key: int
+    result: Any
 
 
 class IdWork(NamedTuple):
@@ -100,46 +207,479 @@ class IdWork(NamedTuple):
     work: Any
 
 
+class Chunk(NamedTuple):
+    """
+    several jobs (or their results) that travel through the queues as one item
+    """
+
+    jobs: List[Any]
+
+
+class SharedJob(NamedTuple):
+    """
+    payload with arrays replaced by descriptors of shared-memory blocks
+    """
+
+    payload: Any
+    block_names: List[str]
+
+
+class SharedResult(NamedTuple):
+    payload: Any
+    job_block_names: List[str]  # unlinked by the worker
+
+
+def _failure_results(stuff, failure: JobFailure) -> List:
+    jobs = stuff.jobs if isinstance(stuff, Chunk) else [stuff]
+    return [(j.eid, failure) if isinstance(j, IdWork) else failure for j in jobs]
+
+
+def _split(stuff) -> List:
+    """
+    :return: the jobs of a chunk as separate stuff
+    """
+    if isinstance(stuff, SharedJob) and isinstance(stuff.payload, Chunk):
+        from util import shared_arrays
+
+        return [SharedJob(j, shared_arrays.block_names(j)) for j in stuff.payload.jobs]
+    elif isinstance(stuff, Chunk):
+        return stuff.jobs
+    else:
+        return [stuff]
+
+
+def _num_jobs(stuff) -> int:
+    if isinstance(stuff, SharedJob):
+        stuff = stuff.payload
+    return len(stuff.jobs) if isinstance(stuff, Chunk) else 1
+
+
+class FeederDone(NamedTuple):
+    """
+    sent by the _Feeder once it sent everything
+    """
+
+
+class _Feeder(threading.Thread):
+    """
+    sends chunks to the workers in the background, so reading the input
+    overlaps with the workers computing and the consumer consuming,
+    in_flight bounds the number of chunks that are sent but not received yet
+    """
+
+    def __init__(
+        self,
+        chunks: Iterator,
+        send: Callable[[Any], None],
+        max_in_flight: int,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.chunks = chunks
+        self.send = send
+        self.done_reader, self.done_writer = mp.Pipe(duplex=False)
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.stopped = threading.Event()
+        self.num_sent = 0
+        self.error = None
+
+    def run(self):
+        try:
+            for chunk in self.chunks:
+                while not self.in_flight.acquire(timeout=0.1):
+                    if self.stopped.is_set():
+                        return
+                if self.stopped.is_set():
+                    return
+                self.send(chunk)
+                self.num_sent += 1
+        except BaseException as e:  # raised in the consuming thread
+            self.error = e
+        finally:
+            self.done_writer.send(FeederDone())
+
+    def received(self):
+        self.in_flight.release()
+
+
 class WorkerPool(object):
-    def __init__(self, processes: int, task: Task, daemons=True) -> None:
+    def __init__(
+        self,
+        processes: int,
+        task: Task,
+        daemons=True,
+        chunksize=1,
+        prefetch=2,
+        shared_memory=False,
+        max_retries=2,
+        job_timeout: float = None,
+        poll_interval=1.0,
+        start_method: str = None,
+        preload: List[str] = None,
+    ) -> None:
+        """
+        :param chunksize: jobs are sent to the workers in chunks of this size
+            and results come back chunk-wise, amortizes pickling and
+            pipe-writes over many tiny jobs
+        :param prefetch: at most prefetch * processes chunks are in flight
+            (queued, processed or waiting to be consumed)
+        :param shared_memory: numpy-arrays and csr-matrices in jobs and results
+            are transported via shared-memory instead of being pickled,
+            tasks get zero-copy views that are only valid during the call
+            (util.shared_arrays, and with it numpy, is only imported then)
+        :param max_retries: jobs of a worker that died (or was killed because of
+            job_timeout) are re-queued that often before they fail, if that many
+            workers in a row die before their task is set up, RuntimeError is
+            raised instead of respawning them forever
+        :param job_timeout: seconds per job, a worker exceeding it gets killed
+        :param poll_interval: seconds between checks for dead or stuck workers
+        :param start_method, preload: see get_context, "spawn" is needed if
+            the parent initialized CUDA, "fork" starts fastest
+        """
         super().__init__()
         self.num_workers = processes
-        self.task_queue = mp.JoinableQueue()
-        self.results_queue = mp.Queue()
+        self.chunksize = chunksize
+        self.prefetch = prefetch
+        self.shared_memory = shared_memory
+        self.shared_blocks = set()  # of jobs that are not processed yet
+        self.max_retries = max_retries
+        self.job_timeout = job_timeout
+        self.poll_interval = poll_interval
+        self.ctx = get_context(start_method, preload)
         self.task = task
         self.daemons = daemons
+        self.workers: List[mp.Process] = []
+        self.task_queues: List[mp.Queue] = []  # one per worker
+        self.readers: List[Connection] = []  # of the workers result-pipes
+        self.assigned: List[List[int]] = []  # per worker, keys sent but not done
+        self.queued = deque()  # of Jobs not assigned to a worker yet
+        self.lock = threading.RLock()  # the feeder-thread dispatches as well
+        self.ready = set()  # pids of workers that set up their task
+        self.setup_failures = 0  # of workers in a row
+        self.keys = count()
+        self.pending: Dict[int, Any] = {}  # sent but not finished
+        self.attempts: Dict[int, int] = {}
+        self.running: Dict[int, Tuple[int, float]] = {}  # pid -> (key, start)
+        self.chunk_of: Dict[int, int] = {}  # key of a job split from a chunk
+        self.parts_left: Dict[int, int] = {}  # per split chunk
+        self.num_finished = 0  # chunks
+
+    def _start_worker(self) -> Tuple[mp.Process, mp.Queue, Connection]:
+        task_queue = self.ctx.Queue()
+        reader, writer = self.ctx.Pipe(duplex=False)
+        worker = Worker(task_queue, writer, self.task)
+        w = self.ctx.Process(target=worker.run, daemon=self.daemons)
+        w.start()
+        writer.close()  # only the worker writes, reader sees EOF when it dies
+        return w, task_queue, reader
 
     def __enter__(self):
-        consumers = [
-            Worker(self.task_queue, self.results_queue, self.task)
-            for i in range(self.num_workers)
-        ]
-        for w in consumers:
-            w.daemon = self.daemons
-            w.start()
+        if self.shared_memory:
+            # workers must share the parents tracker, blocks they create are
+            # unlinked by the parent and vice versa
+            resource_tracker.ensure_running()
+        started = [self._start_worker() for _ in range(self.num_workers)]
+        self.workers = [w for w, _, _ in started]
+        self.task_queues = [q for _, q, _ in started]
+        self.readers = [r for _, _, r in started]
+        self.assigned = [[] for _ in started]
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for i in range(self.num_workers):
-            self.task_queue.put(None)
-        self.task_queue.join()
-        self.results_queue.close()
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for w in self.workers:
+            w.join()
+        for reader in self.readers:
+            reader.close()
+        for task_queue in self.task_queues:
+            task_queue.close()
+        if self.shared_memory:
+            from util import shared_arrays
+
+            shared_arrays.unlink(self.shared_blocks)
+            self.shared_blocks.clear()
+
+    def _chunked(self, data_iter: Iterator) -> Iterator:
+        if self.chunksize == 1:
+            return data_iter
+        return (
+            Chunk(jobs)
+            for jobs in iter(lambda: list(islice(data_iter, self.chunksize)), [])
+        )
 
-    def process_unordered(self, data_g: Iterable):
-        data_iter = iter(data_g)
-        [self.task_queue.put(next(data_iter)) for i in range(self.num_workers)]
-        for datum in data_iter:
-            yield self.results_queue.get()
-            self.task_queue.put(datum)
+    def _share(self, chunk) -> SharedJob:
+        from util import shared_arrays
+
+        blocks = []
+        payload = shared_arrays.share(chunk, blocks)
+        shared_arrays.release(blocks, unlink=False)
+        names = [b.name for b in blocks]
+        self.shared_blocks.update(names)
+        return SharedJob(payload, names)
+
+    def _send(self, stuff) -> int:
+        key = next(self.keys)
+        self.pending[key] = stuff
+        self.attempts[key] = 0
+        self._put(key, stuff)
+        return key
+
+    def _put(self, key: int, stuff):
+        self.queued.append(Job(key, bytes(ForkingPickler.dumps(stuff))))
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        assigns queued jobs to the workers with the fewest unfinished ones,
+        at most prefetch per worker
+        """
+        with self.lock:
+            while len(self.queued) > 0:
+                index = min(
+                    range(self.num_workers), key=lambda i: len(self.assigned[i])
+                )
+                if len(self.assigned[index]) >= max(1, self.prefetch):
+                    break
+                job = self.queued.popleft()
+                self.assigned[index].append(job.key)
+                self.task_queues[index].put(job)
+
+    def _finish(self, key: int):
+        del self.pending[key], self.attempts[key]
+        chunk_key = self.chunk_of.pop(key, None)
+        if chunk_key is not None:
+            self.parts_left[chunk_key] -= 1
+            if self.parts_left[chunk_key] > 0:
+                return
+            del self.parts_left[chunk_key]
+        self.num_finished += 1
+
+    def _unpack(self, results) -> List:
+        if isinstance(results, SharedResult):
+            from util import shared_arrays
+
+            self.shared_blocks.difference_update(results.job_block_names)
+            results = shared_arrays.receive(results.payload)
+        return results.jobs if isinstance(results, Chunk) else [results]
+
+    def _failed(self, stuff, failure: JobFailure) -> List:
+        """
+        :return: failure in place of every result, with ids where needed
+        """
+        if isinstance(stuff, SharedJob):
+            from util import shared_arrays
+
+            shared_arrays.unlink(stuff.block_names)
+            self.shared_blocks.difference_update(stuff.block_names)
+            stuff = stuff.payload
+        return _failure_results(stuff, failure)
 
-        for i in range(self.num_workers):
-            yield self.results_queue.get()
+    def _retry(self, key: int, kind: str, message: str) -> List[List]:
+        """
+        :return: failure-results if the job failed too often, else nothing
+        """
+        stuff = self.pending.get(key)
+        if stuff is None:  # finished meanwhile
+            return []
+        attempts = self.attempts[key] + 1
+        if attempts > self.max_retries:
+            self._finish(key)
+            return [self._failed(stuff, JobFailure(kind, message, None, attempts))]
+        parts = _split(stuff)
+        if len(parts) == 1:
+            self.attempts[key] = attempts
+            self._put(key, stuff)
+        else:  # which job of the chunk crashed is unknown, they are retried
+            # one by one (each with its own attempts), not to fail together
+            del self.pending[key], self.attempts[key]
+            self.parts_left[key] = len(parts)
+            for part in parts:
+                self.chunk_of[self._send(part)] = key
+        return []
+
+    def _handle(self, message) -> List[List]:
+        """
+        :return: results of finished jobs
+        """
+        if isinstance(message, Ready):
+            self.ready.add(message.worker)
+            self.setup_failures = 0
+            return []
+        elif isinstance(message, Started):
+            if any(w.pid == message.worker for w in self.workers):
+                self.running[message.worker] = (message.key, time.time())
+                return []
+            else:  # worker died before this message was received
+                died = "worker %d died" % message.worker
+                return self._retry(message.key, "crashed", died)
+        else:
+            self.running.pop(message.worker, None)
+            with self.lock:
+                for keys in self.assigned:
+                    if message.key in keys:
+                        keys.remove(message.key)
+            results = self._unpack(message.result)
+            if message.key not in self.pending:  # late duplicate of a retried job
+                return []
+            self._finish(message.key)
+            return [results]
+
+    def _check_workers(self) -> List[List]:
+        """
+        respawns dead workers and kills stuck ones, the job they were running is
+        retried, jobs that were assigned to them but not started are re-queued
+        :return: results of jobs that failed too often
+        """
+        finished = []
+        now = time.time()
+        for index, w in enumerate(self.workers):
+            key, start = self.running.get(w.pid, (None, None))
+            timed_out = (
+                key in self.pending
+                and self.job_timeout is not None
+                and now - start > self.job_timeout * _num_jobs(self.pending[key])
+            )
+            if timed_out:
+                w.kill()
+                w.join()
+            if w.is_alive():
+                continue
+            reader = self.readers[index]
+            try:  # messages it managed to send before it died
+                while reader.poll():
+                    finished.extend(self._handle(reader.recv()))
+            except (EOFError, OSError):
+                pass
+            reader.close()
+            if w.pid in self.ready:
+                self.ready.discard(w.pid)
+            else:
+                self.setup_failures += 1
+                if self.setup_failures > self.max_retries:
+                    raise RuntimeError(
+                        "%d workers in a row died before their task was set up, "
+                        "the last exited with %s" % (self.setup_failures, w.exitcode)
+                    )
+            with self.lock:
+                # its queue may hold jobs and a lock it acquired, it is dropped
+                self.task_queues[index].cancel_join_thread()
+                self.task_queues[index].close()
+                keys, self.assigned[index] = self.assigned[index], []
+                started = self._start_worker()
+                (
+                    self.workers[index],
+                    self.task_queues[index],
+                    self.readers[index],
+                ) = started
+                key, _ = self.running.pop(w.pid, (None, None))
+                for k in keys:
+                    if k != key and k in self.pending:
+                        self._put(k, self.pending[k])
+            if key is not None:
+                kind = "timeout" if timed_out else "crashed"
+                message = "worker %d exited with %s" % (w.pid, w.exitcode)
+                finished.extend(self._retry(key, kind, message))
+        return finished
+
+    def _receive(self, feeder: "_Feeder") -> Iterator[List]:
+        """
+        :return: results chunk by chunk (or job by job for chunks that were
+            split on retry), until the feeder is done and every sent chunk
+            came back
+        """
+        num_received = 0
+        num_finished_before = self.num_finished
+        feeder_done = False
+        last_check = time.time()
+        while not feeder_done or num_received < feeder.num_sent:
+            finished = []
+            check = time.time() - last_check > self.poll_interval
+            ready = wait(self.readers + [feeder.done_reader], self.poll_interval)
+            for reader in ready:
+                if reader is feeder.done_reader:
+                    reader.recv()
+                    feeder_done = True
+                    continue
+                try:
+                    finished.extend(self._handle(reader.recv()))
+                except (EOFError, OSError):  # worker is dying
+                    self.workers[self.readers.index(reader)].join()
+                    check = True
+            if check or len(ready) == 0:
+                last_check = time.time()
+                finished.extend(self._check_workers())
+            self._dispatch()
+            while num_received < self.num_finished - num_finished_before:
+                num_received += 1
+                feeder.received()
+            for results in finished:
+                yield results
+
+    def process_unordered(self, data_g: Iterable):
+        """
+        failed jobs yield a JobFailure instead of a result
+        """
+        chunks = self._chunked(iter(data_g))
+        if self.shared_memory:
+            chunks = map(self._share, chunks)
+        feeder = _Feeder(chunks, self._send, self.num_workers * self.prefetch)
+        feeder.start()
+        receiving = self._receive(feeder)
+        try:
+            for results in receiving:
+                yield from results
+            if feeder.error is not None:
+                raise feeder.error
+        finally:  # consumer stopped early, collect what is still in flight
+            feeder.stopped.set()
+            for _ in receiving:
+                pass
+            feeder.join()
+            feeder.done_reader.close()
+            feeder.done_writer.close()
+
+    def process_ordered(self, data_g: Iterable, max_buffer: int = None):
+        """
+        yields results in input-order as soon as they are available, results that
+        arrive early wait in a reorder-buffer, if it is full the feeder is held back
+        :param max_buffer: at most that many jobs are ahead of the oldest
+            unfinished one, defaults to 4 * processes * prefetch * chunksize
+        """
+        if max_buffer is None:
+            max_buffer = 4 * self.num_workers * self.prefetch * self.chunksize
+        # a job that is held back must not be part of the same chunk as the oldest
+        assert max_buffer >= self.chunksize
+        window = threading.Condition()
+        next_eid = 0
+        stopped = False
+
+        def gated_data():
+            for eid, datum in enumerate(data_g):
+                with window:
+                    window.wait_for(lambda: eid < next_eid + max_buffer or stopped)
+                    if stopped:
+                        return
+                yield IdWork(eid, datum)
+
+        results = self.process_unordered(gated_data())
+        buffer: Dict[int, Any] = {}
+        try:
+            for eid, result in results:
+                buffer[eid] = result
+                while next_eid in buffer:
+                    result = buffer.pop(next_eid)
+                    with window:
+                        next_eid += 1
+                        window.notify()
+                    yield result
+        finally:
+            with window:
+                stopped = True
+                window.notify()
+            results.close()
 
     def process(self, data):
-        eided_data = [IdWork(k, d) for k, d in enumerate(data)]
-        assert len(set(w.eid for w in eided_data)) == len(data)
-        id2result = {task_id: r for task_id, r in self.process_unordered(eided_data)}
-        return [id2result[e.eid] for e in eided_data]
+        return list(self.process_ordered(data))
 
 
 #######################################################################################################
@@ -0,0 +1,52 @@
+import os
+import signal
+import time
+
+from util.worker_pool import WorkerPool, Task
+
+
+class Double(Task):
+    def __call__(self, data):
+        return 2 * data
+
+
+class BrokenSetup(Task):
+    def __enter__(self):
+        raise RuntimeError("model file missing")
+
+    def __call__(self, data):
+        return data
+
+
+def idle_worker_killed():
+    """
+    a worker killed while waiting for a job must not block the others, with a
+    shared task-queue one of the idle workers holds its lock
+    """
+    with WorkerPool(processes=2, task=Double(), job_timeout=2) as p:
+        assert p.process([1, 2, 3]) == [2, 4, 6]
+        for index in range(2):
+            time.sleep(0.1)
+            os.kill(p.workers[index].pid, signal.SIGKILL)
+            p.workers[index].join()
+            assert p.process([4, 5, 6]) == [8, 10, 12]
+
+
+def setup_fails():
+    """
+    workers whose task can not be set up are not respawned forever
+    """
+    with WorkerPool(processes=2, task=BrokenSetup(), poll_interval=0.1) as p:
+        try:
+            p.process([1, 2, 3])
+        except RuntimeError as e:
+            print("raised: %s" % e)
+        else:
+            assert False
+
+
+if __name__ == "__main__":
+    start = time.time()
+    idle_worker_killed()
+    setup_fails()
+    print("took: %0.2f seconds" % (time.time() - start))